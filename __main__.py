@@ -10,13 +10,12 @@ selected_types = [
     items.ValidItem.ARTIST.value,
 ]
 keywords = input("Search what (space separated)")
-keywords_ = keywords.split(" ")
+keywords_ = keywords.split()
 
 ctrl = TaskManager(session_id="my_uuid", selected_types=selected_types)
-result = ctrl.search_task(keywords=keywords_, save=True)
-filename = OUTPUT_DIR / ("_".join(["search", *keywords, "0", "4"]) + ".json")
+result = ctrl.search_task(keywords=keywords_, save=True, wait=True)
+filename = OUTPUT_DIR / ("_".join(["search", *keywords_, "0", "4"]) + ".json")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-with open(filename, "w", encoding="utf-8") as f:
-    json.dump(result, f)
+filename.write_text(json.dumps(result), encoding="utf-8")
 
 print(f"Saved search results to {filename}")
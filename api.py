@@ -1,7 +1,6 @@
 import uuid
 from enum import Enum
-from functools import reduce
-from operator import add
+from itertools import chain
 from typing import Annotated, Any, Dict, List, Optional, Set
 
 import commons
@@ -9,13 +8,13 @@ import config
 import constants
 from api_clients.wrappers import DeezerWrapper
 from commons import str_to_values
-from fastapi import FastAPI, Header
+from fastapi import FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.responses import JSONResponse
 from items import ItemStore
 from status import StatusManager
-from tasks import TaskManager
+from tasks import TaskManager, TaskQueueFull
 
 
 class Tags(Enum):
@@ -51,6 +50,13 @@ dzg_api.add_middleware(
 )
 
 
+@dzg_api.exception_handler(TaskQueueFull)
+def task_queue_full_handler(
+    request: Request, exc: TaskQueueFull
+) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"error": str(exc)})
+
+
 # --- Sessions ---
 
 
@@ -80,28 +86,27 @@ def restore_session(
             "edges": List[Dict[str, Any]]
         }
     """
-    graphs = ItemStore().get_graphs(session_id=session_id)
+    store = ItemStore()
+    graphs = store.get_graphs(session_id=session_id)
     if not graphs:
         return {}
+    graph_keys = list(graphs)
+    # serialized under the session lock, searches may still be writing
+    snapshots = [
+        store.snapshot_graph(session_id=session_id, graph_key=graph_key)
+        for graph_key in graph_keys
+    ]
     return {
-        "graph_keys": list(graphs.keys()),
-        "nodes": reduce(
-            add,
-            [
-                commons.nodes_edges_to_list_of_dict(
-                    graph_, which=constants.NODES
-                )
-                for graph_ in graphs.values()
-            ],
+        "graph_keys": graph_keys,
+        "nodes": list(
+            chain.from_iterable(
+                snapshot_[constants.NODES] for snapshot_ in snapshots
+            )
         ),
-        "edges": reduce(
-            add,
-            [
-                commons.nodes_edges_to_list_of_dict(
-                    graph_, which=constants.EDGES, system_=constants.VIS_JS_SYS
-                )
-                for graph_ in graphs.values()
-            ],
+        "edges": list(
+            chain.from_iterable(
+                snapshot_[constants.EDGES] for snapshot_ in snapshots
+            )
         ),
     }
 
@@ -114,20 +119,23 @@ def search(
     keywords: str,
     selected_types: str,
     session_id: Annotated[str, Header()],
+    wait: bool = False,
 ) -> Dict[str, Any]:
     """
     Start new search. Will override graphs with same keywords in same session.
+    Results are published to the task status as they come.
 
     Args:
         keywords (str): '+' separated
         selected_types (str): '+' separated
         session_id (str): uuid
+        wait (bool): whether to respond with the complete graph
 
     Returns:
         {
             "task_id": uuid,
-            "nodes": List[Dict[str, Any]],
-            "edges": List[Dict[str, Any]]
+            "nodes": List[Dict[str, Any]], if wait
+            "edges": List[Dict[str, Any]], if wait
         }
     """
     # Parse params
@@ -136,7 +144,7 @@ def search(
 
     # Start search
     ctrl = TaskManager(session_id=session_id, selected_types=selected_types_)
-    return ctrl.search_task(keywords=keywords_, save=False)
+    return ctrl.search_task(keywords=keywords_, save=False, wait=wait)
 
 
 @dzg_api.get("/api/expand/{graph_key}/{node_id}", tags=[Tags.INTERACTIONS])
@@ -195,17 +203,18 @@ def delete(
             "nodes": List[Dict[str, Any]]
         }
     """
+    store = ItemStore()
     nodes_to_delete = {node_id}
     if cascading:
         nodes_to_delete = nodes_to_delete.union(
-            ItemStore().get_successors(
+            store.get_successors(
                 session_id=session_id,
                 graph_key=graph_key,
                 node_id=node_id,
                 recursive=True,
             )
         )
-    ItemStore().delete_nodes(
+    store.delete_nodes(
         session_id=session_id,
         graph_key=graph_key,
         nodes_ids=list(nodes_to_delete),
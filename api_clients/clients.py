@@ -1,9 +1,49 @@
+import threading
+import time
+from collections import deque
+
 import deezer
+from config import DEEZER_RATE_LIMIT, DEEZER_RATE_PERIOD
 from deezer import Artist, PaginatedList
 
 DEFAULT_LIMIT = 5
 
 
+class RequestRateLimiter:
+    """
+    At most max_requests started per rolling period, callers wait for a slot
+    """
+
+    def __init__(self, max_requests: int, period: float):
+        self._max_requests = max_requests
+        self._period = period
+        self._starts: deque = deque()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        # waiters queue on the lock, slots are handed out one at a time
+        with self._lock:
+            if len(self._starts) >= self._max_requests:
+                oldest = self._starts.popleft()
+                if (delay := oldest + self._period - time.monotonic()) > 0:
+                    time.sleep(delay)
+            self._starts.append(time.monotonic())
+
+
+deezer_limiter = RequestRateLimiter(DEEZER_RATE_LIMIT, DEEZER_RATE_PERIOD)
+
+
+class RateLimitedClient(deezer.Client):
+    """
+    Deezer client sharing the process wide deezer_limiter. Resources and
+    paginated lists request through their client, lazy fetches included
+    """
+
+    def request(self, *args, **kwargs):
+        deezer_limiter.wait()
+        return super().request(*args, **kwargs)
+
+
 class DeezerClientWithLimit(deezer.Client):
     def test(self):
         return self.request(
@@ -135,4 +175,4 @@ class DeezerClientWithLimit(deezer.Client):
         )
 
 
-deezer_client = deezer.Client()  # DeezerClientWithLimit()
+deezer_client = RateLimitedClient()  # DeezerClientWithLimit()
@@ -1,18 +1,45 @@
 import functools
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from difflib import SequenceMatcher
-from typing import Dict, List, Optional, Set, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import commons
 import config
 import deezer
-from commons import utils
+from commons import ThreadSafeSingleton, utils
 from items import DeezerResource, ItemStore, ResourceFactory, ValidItem
 
 from .clients import deezer_client
 
-
-class DeezerWrapper:
+# per-type searches fan out here, never submit from a worker. Deezer
+# requests themselves are paced by the client rate limiter
+_SEARCH_POOL = ThreadPoolExecutor(
+    max_workers=config.SEARCH_WORKERS, thread_name_prefix="search"
+)
+# related chains of search results, apart from _SEARCH_POOL so that long
+# chains don't hold up the per-type searches of other users
+_RELATED_POOL = ThreadPoolExecutor(
+    max_workers=config.RELATED_WORKERS, thread_name_prefix="related"
+)
+# star recommendations fetched ahead, while the backbone chain is walked
+_PREFETCH_POOL = ThreadPoolExecutor(
+    max_workers=config.SEARCH_WORKERS, thread_name_prefix="prefetch"
+)
+
+
+class DeezerWrapper(metaclass=ThreadSafeSingleton):
     REC_SIZE = 5  # Recommendation max size for one node
 
     ALL_TYPES: List[str] = [
@@ -22,6 +49,7 @@ class DeezerWrapper:
         # ValidItem.PLAYLIST.value,
         # ValidItem.SHOW.value, ValidItem.EPISODE.value, ValidItem.AUDIOBOOK.value,
     ]
+    ALL_TYPES_SET: FrozenSet[str] = frozenset(ALL_TYPES)
 
     # Backbone type selector
     BACKBONE_PRIORITIES: Dict[str, int] = {
@@ -30,6 +58,13 @@ class DeezerWrapper:
         ValidItem.TRACK.value: 3,
     }
 
+    # people more likely to search tracks than artists than albums
+    SEARCH_TYPE_PRIORITIES: List[str] = [
+        ValidItem.TRACK.value,
+        ValidItem.ARTIST.value,
+        ValidItem.ALBUM.value,
+    ]
+
     # Recommendation weight for each type when several possible
     TYPE_REC_WEIGHT: Dict[str, int] = {
         ValidItem.ALBUM.value: 1,
@@ -39,8 +74,31 @@ class DeezerWrapper:
         # ValidItem.SHOW.value: 0, ValidItem.EPISODE.value: 0, ValidItem.AUDIOBOOK.value: 0,
     }
 
+    # type -> client call, (client, item_id) and (client, query)
+    FIND_ENDPOINTS: Dict[str, Callable[[deezer.Client, int], Any]] = {
+        ValidItem.ALBUM.value: lambda c, item_id: c.get_album(
+            album_id=item_id
+        ),
+        ValidItem.ARTIST.value: lambda c, item_id: c.get_artist(
+            artist_id=item_id
+        ),
+        ValidItem.TRACK.value: lambda c, item_id: c.get_track(
+            track_id=item_id
+        ),
+    }
+    SEARCH_ENDPOINTS: Dict[str, Callable[[deezer.Client, str], Any]] = {
+        ValidItem.ARTIST.value: lambda c, query: c.search_artists(query),
+        ValidItem.ALBUM.value: lambda c, query: c.search_albums(query),
+        ValidItem.TRACK.value: lambda c, query: c.search(query),
+    }
+
     def __init__(self):
+        """
+        _finding: lookups in flight per (type, id), joined by concurrent finds
+        """
         self.__client = deezer_client
+        self._finding: Dict[Tuple[str, int], Future] = {}
+        self._finding_lock = threading.Lock()
 
     @staticmethod
     def cache(name, obj):
@@ -96,7 +154,9 @@ class DeezerWrapper:
         item_type: Union[ValidItem, str],
     ) -> DeezerResource:
         """
-        Find an item from Deezer
+        Find an item from Deezer.
+        Deezer has no batch lookup, concurrent finds of the same item share
+        a single request.
 
         Args:
             item_id (int): id of the item looked for
@@ -108,23 +168,31 @@ class DeezerWrapper:
         if isinstance(item_type, str):
             item_type = ValidItem(item_type)
 
-        valid_types = [
-            ValidItem.ALBUM.value,
-            ValidItem.ARTIST.value,
-            ValidItem.TRACK.value,
-        ]
-        if item_type.value not in valid_types:
+        if item_type.value not in DeezerWrapper.ALL_TYPES_SET:
             raise ValueError(
                 "[Error: DeezerWrapper.find] Item type not provided or not in "
-                f"{','.join(valid_types)}"
+                f"{','.join(DeezerWrapper.ALL_TYPES)}"
             )
 
-        if item_type == ValidItem.ALBUM:
-            return self.__client.get_album(album_id=item_id)
-        elif item_type == ValidItem.ARTIST:
-            return self.__client.get_artist(artist_id=item_id)
-        # item_type == ValidItem.TRACK:
-        return self.__client.get_track(track_id=item_id)
+        key = (item_type.value, item_id)
+        owned: Future = Future()
+        with self._finding_lock:
+            finding = self._finding.setdefault(key, owned)
+        if finding is not owned:
+            return finding.result()
+
+        try:
+            found = DeezerWrapper.FIND_ENDPOINTS[item_type.value](
+                self.__client, item_id
+            )
+        except Exception as e:
+            finding.set_exception(e)
+            raise
+        finally:
+            with self._finding_lock:
+                del self._finding[key]
+        finding.set_result(found)
+        return found
 
     def _search_item_type(
         self,
@@ -143,12 +211,8 @@ class DeezerWrapper:
         Returns:
             list of matching DeezerResource (subclass corresponding to item type)
         """
-        if item_type == ValidItem.ARTIST.value:
-            return self.__client.search_artists(" ".join(keywords))[:limit]
-        elif item_type == ValidItem.ALBUM.value:
-            return self.__client.search_albums(" ".join(keywords))[:limit]
-        elif item_type == ValidItem.TRACK.value:
-            return self.__client.search(" ".join(keywords))[:limit]
+        if endpoint := DeezerWrapper.SEARCH_ENDPOINTS.get(item_type):
+            return endpoint(self.__client, " ".join(keywords))[:limit]
         raise NotImplementedError(
             f"[Error: DeezerWrapper._search_item_type] "
             f"Item type {item_type} not supported"
@@ -176,11 +240,6 @@ class DeezerWrapper:
         """  # noqa: E501
 
         keywords_str = commons.values_to_str(keywords, sep=" ")
-        type_priorities = [
-            ValidItem.TRACK.value,
-            ValidItem.ARTIST.value,
-            ValidItem.ALBUM.value,
-        ]  # people more likely to search tracks than artists than albums
         # scan all and find best match
 
         search_partial = functools.partial(
@@ -192,25 +251,25 @@ class DeezerWrapper:
         score_partial = functools.partial(
             DeezerWrapper._match_score,
             keywords=keywords_str,
-            types_priority=type_priorities,
+            types_priority=DeezerWrapper.SEARCH_TYPE_PRIORITIES,
             hipster_mode=False,
         )
 
-        # get all candidates for all types
-        all_candidates = sorted(
-            [
-                candidate_res
-                for candidate_type in allowed_types
-                for candidate_res in search_partial(item_type=candidate_type)
-            ],
-            key=lambda c: -score_partial(c),
-        )
+        # get all candidates for all types, best score first
+        # one request per type, concurrently, results in allowed_types order
+        all_candidates: List[DeezerResource] = []
+        for candidates in _SEARCH_POOL.map(
+            lambda type_: search_partial(item_type=type_), allowed_types
+        ):
+            all_candidates.extend(candidates)
+        # reverse sort is stable too, ties keep their search order
+        all_candidates.sort(key=score_partial, reverse=True)
 
         # select the #limit best ones
         best_candidates = {}
         for candidate_resource in all_candidates:
-            for converted in ResourceFactory(
-                resource=candidate_resource
+            for converted in ResourceFactory.factory_for(
+                candidate_resource
             ).to_type(
                 target_type=ValidItem(target_type),
             ):
@@ -278,7 +337,7 @@ class DeezerWrapper:
             (float) a match score
         """
 
-        factory_ = ResourceFactory(resource=candidate)
+        factory_ = ResourceFactory.factory_for(candidate)
 
         # Weight of keywords match
         max_full_name_len = 30 + 70 + 70  # artist + album + track
@@ -304,12 +363,6 @@ class DeezerWrapper:
         # Weight of popularity (people usually search for popular things unless hipster mode activated)
         hipster_multiplier = -1 if hipster_mode else 1
 
-        # Deactivated to simplify - Thresholds
-        # distance = factory_.popularity_distance
-        # bound = 0 if distance < 0 else DeezerWrapper.POPULARITY_UPPERS[candidate.type]
-        # normalization_factor = abs(bound - factory_.popularity_threshold)
-        # w_pop = hipster_multiplier * (distance / normalization_factor)
-
         w_pop = (
             hipster_multiplier * factory_.popularity / 100
         )  # popularity is a percent
@@ -345,9 +398,7 @@ class DeezerWrapper:
         """
         restricted_types = restricted_types or DeezerWrapper.ALL_TYPES
 
-        assert (
-            len(set(restricted_types) - set(DeezerWrapper.ALL_TYPES)) == 0
-        ), (
+        assert DeezerWrapper.ALL_TYPES_SET.issuperset(restricted_types), (
             "[Error: DeezerWrapper.search] "
             f"restricted_types={','.join(restricted_types)} contains illegal values."
             f"Accepted values are {','.join(DeezerWrapper.ALL_TYPES)}"
@@ -366,7 +417,8 @@ class DeezerWrapper:
         )
 
         # Parse and set results to store
-        ItemStore().add_nodes(
+        store = ItemStore()
+        store.add_nodes(
             session_id=session_id,
             graph_key=graph_key,
             items_=search_results,
@@ -375,7 +427,7 @@ class DeezerWrapper:
             is_backbone=True,
         )
 
-        ItemStore().relate(
+        store.relate(
             session_id=session_id,
             graph_key=graph_key,
             parent_id=hash(graph_key),
@@ -403,8 +455,11 @@ class DeezerWrapper:
             **kwargs,
         )
         if max_depth >= 1:
-            for item_ in search_results:
-                related_partial(item_=item_)
+            # independent chains, store writes are serialized per session
+            for _ in _RELATED_POOL.map(
+                lambda item_: related_partial(item_=item_), search_results
+            ):
+                pass
 
         return graph_key
 
@@ -459,13 +514,30 @@ class DeezerWrapper:
                 t: exploration_mode for t in [backbone_type, *star_types]
             }
 
-        assert backbone_type in DeezerWrapper.ALL_TYPES, (
+        assert backbone_type in DeezerWrapper.ALL_TYPES_SET, (
             "[Error: DeezerWrapper.find_related] "
             f"Illegal value for backbone type : {backbone_type}. "
             f"Accepted values are {','.join(DeezerWrapper.ALL_TYPES)}"
         )
 
         # -- Core --
+        # Star items do not depend on the backbone, start fetching them
+        # make sure backbone type not in star types
+        item_star_types = [
+            type_ for type_ in star_types if type_ != backbone_type
+        ]
+        star_future = None
+        if item_star_types:  # If no start type, no star
+            star_future = _PREFETCH_POOL.submit(
+                DeezerWrapper.recommend_from_item,
+                item_=item_,
+                limit_per_type=DeezerWrapper._scale_per_type(
+                    limit=limit or DeezerWrapper.REC_SIZE,
+                    restricted_types=item_star_types,
+                ),
+                exploration_mode=exploration_mode,
+            )
+
         # Get backbone extension first
         backbone_extension = list(
             DeezerWrapper.recommend_from_item(
@@ -479,7 +551,8 @@ class DeezerWrapper:
             f"Backbone extensions larger than 1: {backbone_extension}"
             f"From item {item_}, limit per type = {backbone_type}: 1"
         )
-        ItemStore().add_nodes(
+        store = ItemStore()
+        store.add_nodes(
             session_id=session_id,
             graph_key=graph_key,
             items_=backbone_extension,
@@ -489,7 +562,7 @@ class DeezerWrapper:
             is_backbone=True,
         )
 
-        ItemStore().relate(
+        store.relate(
             session_id=session_id,
             graph_key=graph_key,
             parent_id=item_.id,
@@ -516,24 +589,11 @@ class DeezerWrapper:
             )
 
         # Then get star
-        # make sure backbone type not in star types
-        star_types = [type_ for type_ in star_types if type_ != backbone_type]
-
-        if star_types:  # If no start type, no star
-            limit_per_type = DeezerWrapper._scale_per_type(
-                limit=limit or DeezerWrapper.REC_SIZE,
-                restricted_types=star_types,
-            )
-            star_items = list(
-                DeezerWrapper.recommend_from_item(
-                    item_=item_,
-                    limit_per_type=limit_per_type,
-                    exploration_mode=exploration_mode,
-                )
-            )
+        if star_future is not None:
+            star_items = list(star_future.result())
 
             # Parse and add to store
-            ItemStore().add_nodes(
+            store.add_nodes(
                 session_id=session_id,
                 graph_key=graph_key,
                 items_=star_items,
@@ -543,7 +603,7 @@ class DeezerWrapper:
                 color=kwargs.get("color") or commons.random_color_generator(),
             )
 
-            ItemStore().relate(
+            store.relate(
                 session_id=session_id,
                 graph_key=graph_key,
                 parent_id=item_.id,
@@ -590,7 +650,8 @@ class DeezerWrapper:
         )
 
         # Parse and add to store
-        ItemStore().add_nodes(
+        store = ItemStore()
+        store.add_nodes(
             session_id=session_id,
             graph_key=graph_key,
             items_=list(filled),
@@ -600,7 +661,7 @@ class DeezerWrapper:
             color=color or commons.random_color_generator(),
         )
 
-        ItemStore().relate(
+        store.relate(
             session_id=session_id,
             graph_key=graph_key,
             parent_id=item_.id,
@@ -632,54 +693,15 @@ class DeezerWrapper:
         if exploration_mode is None:
             exploration_mode = {t: False for t in limit_per_type.keys()}
 
-        all_results = set()
-        factory_ = ResourceFactory(resource=item_)
-        if limit := limit_per_type.get(ValidItem.TRACK.value):
-            if not exploration_mode[ValidItem.TRACK.value]:
-                all_results.update(
-                    set(
-                        factory_.dive(target_type=ValidItem.TRACK, limit=limit)
-                    )
-                )
-            else:
-                all_results.update(
-                    set(
-                        factory_.explore(
-                            target_type=ValidItem.TRACK, limit=limit
-                        )
-                    )
-                )
-        if limit := limit_per_type.get(ValidItem.ALBUM.value):
-            # get artists albums
-            if not exploration_mode[ValidItem.ALBUM.value]:
-                all_results.update(
-                    set(
-                        factory_.dive(target_type=ValidItem.ALBUM, limit=limit)
-                    )
-                )
-            else:
-                all_results.update(
-                    set(
-                        factory_.explore(
-                            target_type=ValidItem.ALBUM, limit=limit
-                        )
-                    )
-                )
-        if limit := limit_per_type.get(ValidItem.ARTIST.value):
-            if not exploration_mode[ValidItem.ARTIST.value]:
-                all_results.update(
-                    set(
-                        factory_.dive(
-                            target_type=ValidItem.ARTIST, limit=limit
-                        )
-                    )
-                )
-            else:
-                all_results.update(
-                    set(
-                        factory_.explore(
-                            target_type=ValidItem.ARTIST, limit=limit
-                        )
-                    )
+        all_results: Set[DeezerResource] = set()
+        factory_ = ResourceFactory.factory_for(item_)
+        for type_ in (ValidItem.TRACK, ValidItem.ALBUM, ValidItem.ARTIST):
+            if limit := limit_per_type.get(type_.value):
+                # explore gets from different artists, dive from the same
+                recommend = (
+                    factory_.explore
+                    if exploration_mode[type_.value]
+                    else factory_.dive
                 )
+                all_results.update(recommend(target_type=type_, limit=limit))
         return all_results
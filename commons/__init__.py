@@ -1,14 +1,24 @@
 from .metaclasses import ThreadSafeSingleton
 from .utils import (
+    append_graph_changes,
+    commutative_bytes,
     commutative_hash,
+    commutative_hash_from,
+    csr_adjacency,
+    csr_reachable,
     di_graph_from_list_of_dict,
     dict_extend,
+    edges_to_list_of_dict,
+    ensure_dir,
+    graph_to_dict,
     is_uuid,
     load_from_yml,
     nodes_edges_to_list_of_dict,
+    nodes_to_list_of_dict,
     order_words,
     random_color_generator,
     scale_weights,
     str_to_values,
     values_to_str,
+    write_graph_json,
 )
@@ -15,10 +15,10 @@ class ThreadSafeSingleton(type):
     _singleton_locks: Dict[Any, threading.Lock] = {}
 
     def __call__(cls, *args, **kwargs):
+        # only construction is locked, instances guard their own state
         if cls not in cls._instances:
-            if cls not in cls._singleton_locks:
-                cls._singleton_locks[cls] = threading.Lock()
-            with cls._singleton_locks[cls]:
+            # setdefault is atomic, racing threads share the same lock
+            with cls._singleton_locks.setdefault(cls, threading.Lock()):
                 if cls not in cls._instances:
                     cls._instances[cls] = super(
                         ThreadSafeSingleton, cls
@@ -27,8 +27,6 @@ class ThreadSafeSingleton(type):
 
     @classmethod
     def destroy(mcs, cls):
-        if cls not in cls._singleton_locks:
-            cls._singleton_locks[cls] = threading.Lock()
-        with cls._singleton_locks[cls]:
+        with cls._singleton_locks.setdefault(cls, threading.Lock()):
             if cls in mcs._instances:
                 del mcs._instances[cls]
@@ -1,45 +1,137 @@
 import hashlib
+import json
+import os
 import random
-import uuid
-from copy import deepcopy
+import re
+from collections import OrderedDict
+from copy import copy
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import constants
 import networkx as nx  # type: ignore
 import numpy as np
 import yaml
 
+# libyaml-backed loader when available, same output as yaml.safe_load
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+CSS4_COLORS_LOWER = tuple(
+    color.lower() for color in constants.CSS4_COLORS.values()
+)
+
 
 def random_color_generator():
-    color = random.choice(list(constants.CSS4_COLORS.values())).lower()
-    return color
+    return random.choice(CSS4_COLORS_LOWER)
+
+
+YML_CACHE_SIZE = 100
+# path -> (mtime, size, content)
+_yml_cache: OrderedDict[str, Tuple[float, int, Dict[str, Any]]] = OrderedDict()
 
 
 def load_from_yml(path: Union[str, Path]) -> Dict[str, Any]:
-    if not Path(path).exists():
+    """
+    Load a yml file. Parsed content is cached until the file changes
+    (mtime or size) and must not be mutated by callers.
+
+    Args:
+        path: yml file path
+
+    Returns:
+        parsed content, {} if file does not exist
+    """
+    path = Path(path)
+    try:
+        stat_ = path.stat()
+    except FileNotFoundError:
         return {}
+    key = str(path.resolve())
+    cached = _yml_cache.get(key)
+    if cached is not None and cached[:2] == (stat_.st_mtime, stat_.st_size):
+        _yml_cache.move_to_end(key)
+        return cached[2]
+
+    content = _load_yml_with_sidecar(path, stat_=stat_)
+    _yml_cache[key] = (stat_.st_mtime, stat_.st_size, content)
+    if len(_yml_cache) > YML_CACHE_SIZE:
+        _yml_cache.popitem(last=False)
+    return content
+
+
+def _load_yml_with_sidecar(path: Path, stat_: os.stat_result) -> Any:
+    """
+    Parse yml, going through a <name>.yml.json sidecar written from the very
+    same file (mtime_ns and size recorded in it). The sidecar is only written
+    when the content survives a json round trip (no dates, non-string keys...).
+    """
+    sidecar = path.with_suffix(path.suffix + ".json")
+    source = [stat_.st_mtime_ns, stat_.st_size]
+    try:
+        cached = json.loads(sidecar.read_bytes())
+        if cached["source"] == source:
+            return cached["content"]
+    except (OSError, ValueError, TypeError, KeyError):
+        pass
+
     with open(path, "r") as f:
-        content = yaml.safe_load(f)
+        content = yaml.load(f, Loader=YamlLoader)  # nosec B506
+    try:
+        dumped = json.dumps(content)
+        if json.loads(dumped) == content:
+            sidecar.write_text(
+                json.dumps({"source": source, "content": content}),
+                encoding="utf-8",
+            )
+    except (OSError, TypeError, ValueError):
+        pass  # sidecar is best effort, e.g. read-only fs
     return content
 
 
+_created_dirs: Set[Path] = set()
+
+
+def ensure_dir(path: Path):
+    """
+    Create directory and its parents once per process
+
+    Args:
+        path: directory to create if missing
+    """
+    if path in _created_dirs:
+        return
+    path.mkdir(parents=True, exist_ok=True)
+    _created_dirs.add(path)
+
+
 def values_to_str(
     values: Union[List[str], str],
     sep: str = ",",
 ) -> str:
     if isinstance(values, str):
         return values
-    return sep.join([value.strip() for value in values])
+    if len(values) == 1:
+        return values[0].strip()
+    return sep.join(map(str.strip, values))
+
+
+@lru_cache(maxsize=16)
+def _split_pattern(sep: str) -> re.Pattern:
+    # separator with its surrounding whitespace, split and strip in one pass
+    return re.compile(rf"\s*{re.escape(sep)}\s*")
 
 
 def str_to_values(values: str, sep: str = ",") -> List[str]:
-    return [value.strip() for value in values.split(sep)]
+    return _split_pattern(sep).split(values.strip())
 
 
+@lru_cache(maxsize=1024)
 def order_words(s: str, sep: str = " ", fixed_len: int = 0):
     """
-    Return input string with sorted words
+    Return input string with sorted words, memoized
     e.g. 'bob and alice' -> 'alice and bob'
 
     Args:
@@ -62,14 +154,44 @@ def dict_extend(*args) -> Dict[Any, Any]:
     """
     d: Dict[Any, Any] = {}
     for entry in args:
-        for key in entry:
+        for key, value in entry.items():
             if d.get(key):
-                d[key] += deepcopy(entry)[key]
+                d[key] = d[key] + value  # new object, inputs untouched
             else:
-                d[key] = deepcopy(entry)[key]
+                d[key] = copy(value)
     return d
 
 
+def _take_from_largest(remaining: np.ndarray, units: int) -> np.ndarray:
+    """
+    Closed form of taking units one at a time from the largest positive bin
+    (lowest index first on ties), until units or bins are exhausted.
+
+    Args:
+        remaining: available units per bin
+        units: how many units to take
+
+    Returns:
+        units taken per bin
+    """
+    available = np.clip(remaining, 0, None)
+    units = min(max(units, 0), int(available.sum()))
+    # lowest level h such that lowering every bin to h takes at most units
+    low, high = 0, int(available.max(initial=0))
+    while low < high:
+        level = (low + high) // 2
+        if int((available - level).clip(0).sum()) <= units:
+            high = level
+        else:
+            low = level + 1
+    taken = (available - low).clip(0)
+    # leftover units are taken from the bins sitting at that level
+    extra = units - int(taken.sum())
+    if extra > 0:
+        taken[np.flatnonzero(available >= low)[:extra]] += 1
+    return taken
+
+
 def scale_weights(
     relative_weights: List[int],
     target_sum: int,
@@ -95,19 +217,14 @@ def scale_weights(
             f"target_sum={target_sum}, relative_weights: {relative_weights}"
         )  # noqa: E501
     n = len(relative_weights)
-    res = [1] * n if include_all else [0] * n
-    remaining = (
-        [w - 1 for w in relative_weights]
-        if include_all
-        else relative_weights.copy()
-    )
-    used = n if include_all else 0
-    _next = np.argmax(remaining)
-    while used < target_sum and remaining[_next] > 0:
-        remaining[_next] -= 1
-        res[_next] += 1
-        used += 1
-        _next = np.argmax(remaining)
+    if n == 0:
+        return []
+    remaining = np.asarray(relative_weights, dtype=np.int64)
+    if include_all:
+        remaining = remaining - 1
+    taken = _take_from_largest(remaining, units=target_sum - n * include_all)
+    res = (taken + 1 if include_all else taken).tolist()
+    used = n * include_all + int(taken.sum())
 
     if used < target_sum:
         res = [
@@ -123,6 +240,64 @@ def scale_weights(
     return res
 
 
+def nodes_to_list_of_dict(
+    g: nx.DiGraph,
+    nbunch: Optional[Iterable[Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Convert graph nodes to a list of dicts
+
+    Args:
+        g: graph to extract nodes from
+        nbunch (optional): only these nodes, all if None
+
+    Returns:
+        list of [{'id': node id, **properties}]
+    """
+    # node -> attributes dict, without the NodeView layer
+    nodes_data = g._node
+    if nbunch is None:
+        return [dict(i_props, id=i_id) for i_id, i_props in nodes_data.items()]
+    return [dict(nodes_data[i_id], id=i_id) for i_id in nbunch]
+
+
+def edges_to_list_of_dict(
+    g: nx.DiGraph,
+    system_: str = constants.VIS_JS_SYS,
+    ebunch: Optional[Iterable[Tuple[Any, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Convert graph edges to a list of dicts
+
+    Args:
+        g: graph to extract edges from
+        system_: 'python' or 'vis.js' to define serialization api keys
+        ebunch (optional): only these (source, target) edges, all if None
+
+    Returns:
+        list of [{from_key: source id, to_key: target id, **properties}]
+    """
+    assert system_ in (constants.VIS_JS_SYS, constants.PYTHON_SYS)
+    from_key_name = "u_of_edge" if system_ == constants.PYTHON_SYS else "from"
+    to_key_name = "v_of_edge" if system_ == constants.PYTHON_SYS else "to"
+    # source -> target -> attributes dict, without the EdgeView layer
+    successors = g._succ
+    if ebunch is None:
+        return [
+            {**i_props, from_key_name: source_id, to_key_name: to_id}
+            for source_id, targets in successors.items()
+            for to_id, i_props in targets.items()
+        ]
+    return [
+        {
+            **successors[source_id][to_id],
+            from_key_name: source_id,
+            to_key_name: to_id,
+        }
+        for source_id, to_id in ebunch
+    ]
+
+
 def nodes_edges_to_list_of_dict(
     g: nx.DiGraph,
     which: str,
@@ -143,17 +318,132 @@ def nodes_edges_to_list_of_dict(
     assert which in (constants.NODES, constants.EDGES)
 
     if which == constants.NODES:
-        nodes_ = g.nodes(data=True)
-        return [{"id": i_id, **i_props} for i_id, i_props in nodes_]
+        return nodes_to_list_of_dict(g)
+    return edges_to_list_of_dict(g, system_=system_)
 
-    assert system_ in (constants.VIS_JS_SYS, constants.PYTHON_SYS)
-    from_key_name = "u_of_edge" if system_ == constants.PYTHON_SYS else "from"
-    to_key_name = "v_of_edge" if system_ == constants.PYTHON_SYS else "to"
-    edges_ = g.edges(data=True)
-    return [
-        {from_key_name: source_id, to_key_name: to_id, **i_props}
-        for source_id, to_id, i_props in edges_
+
+def graph_to_dict(
+    g: nx.DiGraph, system_: str = constants.VIS_JS_SYS
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Convert graph nodes and edges to lists of dicts, in one call
+
+    Args:
+        g: graph to serialize
+        system_: 'python' or 'vis.js' to define serialization api keys
+
+    Returns:
+        {'nodes': [{'id': node id, **properties}], 'edges': [...]}
+    """
+    return {
+        constants.NODES: nodes_to_list_of_dict(g),
+        constants.EDGES: edges_to_list_of_dict(g, system_=system_),
+    }
+
+
+def _json_default(value: Any) -> Any:
+    # enums (node colors...) by value, anything else as text
+    return getattr(value, "value", str(value))
+
+
+def write_graph_json(g: nx.DiGraph, path: Union[str, Path]):
+    """
+    Write graph as node-link json
+
+    Args:
+        g: graph to write
+        path: destination file
+    """
+    Path(path).write_text(
+        json.dumps(nx.node_link_data(g, edges="edges"), default=_json_default)
+    )
+
+
+def append_graph_changes(
+    path: Union[str, Path],
+    nodes: List[Dict[str, Any]],
+    edges: List[Dict[str, Any]],
+):
+    """
+    Append nodes and edges to a json lines file, one {"node": ...} or
+    {"edge": ...} object per line
+
+    Args:
+        path: destination file
+        nodes: [{'id': node id, **properties}]
+        edges: [{from_key: source id, to_key: target id, **properties}]
+    """
+    lines = [
+        json.dumps({key_: value_}, default=_json_default) + "\n"
+        for key_, values_ in (("node", nodes), ("edge", edges))
+        for value_ in values_
     ]
+    with open(path, "a") as file_:
+        file_.writelines(lines)
+
+
+def csr_adjacency(
+    g: nx.DiGraph, reverse: bool = False
+) -> Tuple[Dict[Any, int], np.ndarray, Tuple[Any, ...], np.ndarray]:
+    """
+    Compressed sparse row view of a graph adjacency
+    Neighbors of node are neighbors[offsets[i]:offsets[i + 1]], i = index[node]
+    and their rows indices[offsets[i]:offsets[i + 1]]
+
+    Args:
+        g: graph to compress
+        reverse: whether to compress predecessors instead of successors
+
+    Returns:
+        (index, offsets, neighbors, indices)
+    """
+    adjacency = g.pred if reverse else g.succ
+    index = {node: i for i, node in enumerate(adjacency)}
+    offsets = np.zeros(len(index) + 1, dtype=np.int64)
+    np.cumsum(
+        np.fromiter(map(len, adjacency.values()), np.int64, len(index)),
+        out=offsets[1:],
+    )
+    neighbors = tuple(chain.from_iterable(adjacency.values()))
+    indices = np.fromiter(map(index.__getitem__, neighbors), np.int32)
+    return index, offsets, neighbors, indices
+
+
+def csr_reachable(
+    offsets: np.ndarray,
+    indices: np.ndarray,
+    rows: np.ndarray,
+    seen: np.ndarray,
+) -> np.ndarray:
+    """
+    Breadth first walk on a csr adjacency, one vectorized step per level
+
+    Args:
+        offsets: csr offsets, see csr_adjacency
+        indices: csr neighbors rows, see csr_adjacency
+        rows: rows to walk from
+        seen: bool mask of rows not to return nor walk through, updated
+
+    Returns:
+        rows reached from rows, rows excluded
+    """
+    reached = []
+    frontier = np.asarray(rows, dtype=np.int64)
+    while frontier.size:
+        starts = offsets[frontier]
+        lengths = offsets[frontier + 1] - starts
+        # position of each neighbor in indices, concatenated slices
+        shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        next_ = indices[shift + np.arange(int(lengths.sum()))]
+        frontier = np.unique(next_[~seen[next_]])
+        seen[frontier] = True
+        reached.append(frontier)
+    if not reached:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(reached)
+
+
+EDGE_ENDPOINT_KEYS = frozenset(("from", "to", "u_of_edge", "v_of_edge"))
 
 
 def di_graph_from_list_of_dict(
@@ -169,46 +459,71 @@ def di_graph_from_list_of_dict(
         nx.DiGraph filled
     """
     g_ = nx.DiGraph()
-    for node in nodes:
-        g_.add_node(
-            node_for_adding=node["id"],
-            **{key: value for key, value in node.items() if key != "id"},
+    g_.add_nodes_from(
+        (
+            node["id"],
+            {key: value for key, value in node.items() if key != "id"},
         )
+        for node in nodes
+    )
     if edges is None:
         return g_
-    for edge in edges:
-        g_.add_edge(
-            u_of_edge=edge.get("u_of_edge") or edge.get("from"),
-            v_of_edge=edge.get("v_of_edge") or edge.get("to"),
-            **{
+    g_.add_edges_from(
+        (
+            edge.get("u_of_edge") or edge.get("from"),
+            edge.get("v_of_edge") or edge.get("to"),
+            {
                 key: value
                 for key, value in edge.items()
-                if key
-                not in (
-                    "from",
-                    "to",
-                    "u_of_edge",
-                    "v_of_edge",
-                )
+                if key not in EDGE_ENDPOINT_KEYS
             },
         )
+        for edge in edges
+    )
     return g_
 
 
+UUID_PATTERN = re.compile(
+    r"(?:urn:)?(?:uuid:)?\{?"
+    r"[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}"
+    r"\}?",
+    flags=re.IGNORECASE,
+)
+# bare 32 hex chars up to 'urn:uuid:{...}' with all hyphens
+UUID_LENGTHS = range(32, 48)
+
+
+@lru_cache(maxsize=4096)
 def is_uuid(candidate: str) -> bool:
     """
     Check if candidate is uuid format string
+    Hyphenated (8-4-4-4-12) or bare 32 hex digits, optionally in braces
+    and prefixed with 'urn:uuid:'. Stricter than uuid.UUID, which also
+    accepts hyphens at any position
     Args:
         candidate (str)
 
     Returns:
         (bool)
     """
-    try:
-        uuid.UUID(candidate)
-    except ValueError:
+    if len(candidate) not in UUID_LENGTHS:
         return False
-    return True
+    return UUID_PATTERN.fullmatch(candidate) is not None
+
+
+def commutative_bytes(*args) -> bytes:
+    """
+    Ordered utf-8 bytes of the join of args, the commutative_hash input
+    Precompute it for a shared argument, see commutative_hash_from
+
+    Args:
+        *args: list of strings. will be converted to strings if not
+
+    Returns:
+        sorted bytes (with duplicates)
+    """
+    # sorting raw bytes keeps the multiset without building one str per char
+    return bytes(sorted("".join(map(str, args)).encode("utf-8")))
 
 
 def commutative_hash(*args):
@@ -219,7 +534,23 @@ def commutative_hash(*args):
         *args: list of strings. will be converted to strings if not
 
     Returns:
-        hash of ordered join of all letters (with duplicates)
+        hash of ordered join of all utf-8 bytes (with duplicates)
+    """
+    return hashlib.blake2b(commutative_bytes(*args), digest_size=4).hexdigest()
+
+
+def commutative_hash_from(ordered_: bytes, *args):
+    """
+    commutative_hash(*prefix_args, *args) with ordered_ precomputed
+    as commutative_bytes(*prefix_args)
+
+    Args:
+        ordered_: commutative_bytes of the shared arguments
+        *args: other strings. will be converted to strings if not
+
+    Returns:
+        same hash as commutative_hash with all arguments
     """
-    ordered_ = "".join(sorted(list("".join([str(arg) for arg in args]))))
-    return hashlib.shake_128(ordered_.encode("utf-8")).hexdigest(4)
+    # already sorted run + short tail, cheap merge for timsort
+    merged_ = sorted(ordered_ + "".join(map(str, args)).encode("utf-8"))
+    return hashlib.blake2b(bytes(merged_), digest_size=4).hexdigest()
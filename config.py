@@ -1,5 +1,6 @@
 from enum import Enum
 from pathlib import Path
+from types import MappingProxyType
 
 from commons.utils import load_from_yml
 
@@ -9,13 +10,41 @@ OUTPUT_DIR = PROJECT_ROOT / "outputs"
 
 # -- conf.yml ---
 
-CONF = load_from_yml(PROJECT_ROOT / "conf.yml")
+# read-only view: the parsed content is shared through load_from_yml's cache
+CONF = MappingProxyType(load_from_yml(PROJECT_ROOT / "conf.yml") or {})
 
 # --- API ---
 API_HOST = CONF.get("DZG_API_HOST", "localhost")
 API_PORT = int(CONF.get("DZG_API_PORT", 8502)) or None
 
 
+# --- Deezer ---
+# deezer requests started per rolling period, process wide, for the
+# 50 requests / 5s quota. Every call of the deezer client waits for a slot
+DEEZER_RATE_LIMIT = int(CONF.get("DZG_DEEZER_RATE_LIMIT", 50))
+DEEZER_RATE_PERIOD = float(CONF.get("DZG_DEEZER_RATE_PERIOD", 5))
+# threads of the search, prefetch and fill pools, paced by the rate limit
+SEARCH_WORKERS = int(CONF.get("DZG_SEARCH_WORKERS", 16))
+# threads walking the related chains of search results, all searches
+RELATED_WORKERS = int(CONF.get("DZG_RELATED_WORKERS", 16))
+# concurrent searches and expansions, mostly waiting on deezer (and on
+# each other when joining an expansion in flight), not on cpu
+TASK_WORKERS = int(CONF.get("DZG_TASK_WORKERS", 32))
+# concurrent per-artist page fetches (albums, top, related), process wide
+FETCH_WORKERS = int(CONF.get("DZG_FETCH_WORKERS", 8))
+
+# --- Store ---
+ITEMS_CACHE_SIZE = int(CONF.get("DZG_ITEMS_CACHE_SIZE", 10000))
+# graphs whose items stay alive beyond the items cache, least recently
+# written released first
+PINNED_GRAPHS_SIZE = int(CONF.get("DZG_PINNED_GRAPHS_SIZE", 64))
+# sqlite file shared by workers for the items cache, per process if None
+SHARED_ITEMS_CACHE_PATH = CONF.get("DZG_SHARED_ITEMS_CACHE_PATH")
+# packed adjacency for read-heavy sessions, rebuilt after each graph write
+CSR_ADJACENCY = bool(CONF.get("DZG_CSR_ADJACENCY", False))
+# saved graphs as gml, node-link json otherwise
+WRITE_GML_LEGACY = bool(CONF.get("DZG_WRITE_GML_LEGACY", False))
+
 # --- Styling ---
 
 EDGE_WIDTH = 10
@@ -7,15 +7,21 @@ Contains:
     - one class for each deezer item type
 """
 import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from math import sqrt
-from typing import Annotated, Any, Dict, List, Tuple
+from functools import cached_property, lru_cache
+from itertools import chain, islice
+from math import isqrt
+from typing import Annotated, Any, Callable, Dict, List, Optional, Tuple
 
 import deezer  # type: ignore
-from commons import scale_weights
-from config import NodeColor
+import numpy as np
+from config import FETCH_WORKERS, NodeColor
 from deezer.exceptions import DeezerErrorResponse
-from pydantic import BaseModel
 from pydantic.functional_validators import BeforeValidator
 
 # -- Validators --
@@ -33,7 +39,7 @@ DeezerResource = Annotated[Any, BeforeValidator(is_deezer_resource)]
 # -- Utils --
 
 
-class ValidItem(Enum):  # should match deezer types
+class ValidItem(str, Enum):  # should match deezer types, == its value
     ALBUM = "album"
     ARTIST = "artist"
     PLAYLIST = "playlist"
@@ -55,23 +61,248 @@ POPULARITY_UPPERS: Dict[str, int] = {
     ValidItem.TRACK.value: int(1e6),  # Known upper limit
 }
 
+# -- Dispatch tables: exact resource class -> getter --
+
+LABEL_GETTERS: Dict[type, Callable[[Any], str]] = {
+    deezer.Artist: lambda r: r.name,
+    deezer.Album: lambda r: r.title,
+    deezer.Track: lambda r: r.title,
+}
+
+# (source class, target type) -> related resource of the target type
+TARGET_RESOURCE_GETTERS: Dict[Tuple[type, ValidItem], Callable[[Any], Any]] = {
+    (deezer.Artist, ValidItem.ALBUM): lambda r: r.get_albums(limit=1)[0],
+    (deezer.Track, ValidItem.ALBUM): lambda r: r.album,
+    (deezer.Album, ValidItem.ARTIST): lambda r: r.artist,
+    (deezer.Track, ValidItem.ARTIST): lambda r: r.artist,
+    (deezer.Album, ValidItem.TRACK): lambda r: r.tracks[0],
+    (deezer.Artist, ValidItem.TRACK): lambda r: r.get_top(limit=1)[0],
+}
+
+# getters take the ResourceFactory, titles are built by its helpers
+TITLE_GETTERS: Dict[type, Callable[[Any], str]] = {
+    deezer.Artist: lambda f: f._artist_title,
+    deezer.Album: lambda f: f._album_title,
+    deezer.Track: lambda f: f._track_title,
+}
+
+
+def _contributor_ids(factory: Any) -> Tuple[int, ...]:
+    return tuple(a["id"] for a in factory._as_dict["contributors"])
+
+
+# getters take the ResourceFactory to read its cached as_dict
+ARTIST_IDS_GETTERS: Dict[type, Callable[[Any], Tuple[int, ...]]] = {
+    deezer.Artist: lambda f: (f.resource.id,),
+    deezer.Album: _contributor_ids,
+    deezer.Track: _contributor_ids,
+}
+
+IMAGE_GETTERS: Dict[type, Callable[[Any], str | None]] = {
+    deezer.Artist: lambda r: r.picture_medium,
+    deezer.Album: lambda r: r.cover_medium,
+    deezer.Track: lambda r: None,  # no image for tracks
+}
+
+# only tracks have a preview, other classes default to None
+PREVIEW_URL_GETTERS: Dict[type, Callable[[Any], str | None]] = {
+    deezer.Track: lambda r: r.preview,
+}
+
+POPULARITY_INDICATOR_GETTERS: Dict[type, Callable[[Any], int]] = {
+    deezer.Track: lambda r: r.rank,
+    deezer.Artist: lambda r: r.nb_fan,
+    deezer.Album: lambda r: r.fans,
+}
+
+# (threshold, upper) packed per class, one probe instead of a str hash each
+POPULARITY_BOUNDS: Dict[type, Tuple[int, int]] = {
+    class_: (POPULARITY_THRESHOLDS[type_], POPULARITY_UPPERS[type_])
+    for class_, type_ in (
+        (deezer.Artist, ValidItem.ARTIST.value),
+        (deezer.Album, ValidItem.ALBUM.value),
+        (deezer.Track, ValidItem.TRACK.value),
+    )
+}
+
+# getters take the ResourceFactory, conversions go through its cached fetches
+TO_TYPE_GETTERS: Dict[ValidItem, Callable[[Any], List[Any]]] = {
+    ValidItem.ALBUM: lambda f: [f._album],
+    ValidItem.ARTIST: lambda f: f._artists,
+    ValidItem.TRACK: lambda f: [f._track],
+}
+
+# -- Remote lookups --
+
+ARTIST_RELATIONS_CACHE_SIZE = 1024
+ARTIST_RELATIONS_TTL = 3600  # seconds
+# samples are drawn from the first limit * factor items, not the whole list
+SAMPLE_WINDOW_FACTOR = 4
+# (artist id, relation, window) -> (expiry, fetched resources), shared by
+# all factories
+_artist_relations: OrderedDict[
+    Tuple[int, str, Optional[int]], Tuple[float, Tuple[Any, ...]]
+] = OrderedDict()
+_artist_relations_lock = threading.Lock()
+
+
+def _artist_relation(
+    artist: deezer.Artist, relation: str, window: Optional[int] = None
+) -> Tuple[Any, ...]:
+    """
+    Fetch an artist paginated relation (albums, top, related) once per
+    artist id, then again once ARTIST_RELATIONS_TTL has passed (LRU bounded)
+
+    Args:
+        artist (deezer.Artist): artist to get the relation of
+        relation (str): deezer relation path
+        window (int): if provided, only fetch the first window items
+
+    Returns:
+        (Tuple[DeezerResource]) items of the relation
+    """
+    key = (artist.id, relation, window)
+    with _artist_relations_lock:
+        if (cached := _artist_relations.get(key)) is not None:
+            if cached[0] >= time.monotonic():
+                _artist_relations.move_to_end(key)
+                return cached[1]
+            del _artist_relations[key]
+    pages = artist.get_paginated_list(
+        relation, params={"limit": window} if window else None
+    )
+    fetched = tuple(islice(pages, window))
+    expires_at = time.monotonic() + ARTIST_RELATIONS_TTL
+    with _artist_relations_lock:
+        _artist_relations[key] = (expires_at, fetched)
+        _artist_relations.move_to_end(key)
+        if len(_artist_relations) > ARTIST_RELATIONS_CACHE_SIZE:
+            _artist_relations.popitem(last=False)
+    return fetched
+
+
+_FETCH_POOL = ThreadPoolExecutor(
+    max_workers=FETCH_WORKERS, thread_name_prefix="deezer-fetch"
+)
+
+DIVE_RELATIONS: Dict[ValidItem, str] = {
+    ValidItem.ALBUM: "albums",
+    # fixMe: get_radio has a bug. it gives the calling artist as the artist
+    ValidItem.TRACK: "top",
+}
+
+
+def _dive_candidates(
+    artist: deezer.Artist, relation: str, limit: int
+) -> Tuple[Any, ...]:
+    """Relation window to sample limit items from, empty on deezer errors"""
+    try:
+        return _artist_relation(
+            artist, relation, window=limit * SAMPLE_WINDOW_FACTOR
+        )
+    except DeezerErrorResponse:
+        return ()
+
+
+ARTISTS_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=ARTISTS_CACHE_SIZE)
+def _get_artist(client: deezer.Client, artist_id: int) -> deezer.Artist:
+    """
+    Full artist resource, fetched once per id. Contributors of albums and
+    tracks are partial and the same artists show up across many of them.
+    Deezer has no batch endpoint for artists.
+    """
+    return client.get_artist(artist_id)
+
+
+@lru_cache(maxsize=256)
+def _uniform_weights(n_bins: int, target_sum: int) -> Tuple[int, ...]:
+    """
+    scale_weights of n_bins equal weights, in closed form: every bin gets
+    the quotient and the first ones share the remainder
+    """
+    if n_bins == 0:
+        return ()
+    base, remainder = divmod(target_sum, n_bins)
+    return (base + 1,) * remainder + (base,) * (n_bins - remainder)
+
+
+def _contributors(resource: Any) -> List[deezer.Artist]:
+    return [_get_artist(a.client, a.id) for a in resource.contributors]
+
+
+ALBUM_GETTERS: Dict[type, Callable[[Any], deezer.Album]] = {
+    deezer.Album: lambda r: r,
+    deezer.Track: lambda r: r.album.get(),
+    deezer.Artist: lambda r: r.get_albums()[0],
+}
+
+TRACK_GETTERS: Dict[type, Callable[[Any], deezer.Track]] = {
+    deezer.Track: lambda r: r,
+    deezer.Album: lambda r: r.get_tracks()[0],
+    deezer.Artist: lambda r: r.get_top()[0],
+}
+
+ARTISTS_GETTERS: Dict[type, Callable[[Any], List[deezer.Artist]]] = {
+    deezer.Artist: lambda r: [r],
+    deezer.Album: _contributors,
+    deezer.Track: _contributors,
+}
+
+
+# (resource class, id) -> live factory, entries drop once unreferenced
+_factory_pool: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+_factory_pool_lock = threading.Lock()
+
 # -- Classes --
 
 
-class ResourceFactory(BaseModel):
+class ResourceFactory:
     """
     Helper around deezer.Resource subclasses
 
     Warning: deezer connector fetches foreign attributes.
     To avoid API call, convert to dict
+    Derived properties and remote fetches (_album, _track, _artists)
+    are computed once per instance (cached_property)
+    Plain class, built for every item touched: no pydantic validation
     """
 
-    resource: DeezerResource
+    def __init__(self, resource: DeezerResource):
+        self.resource = resource
+
+    @classmethod
+    def factory_for(cls, resource: DeezerResource) -> "ResourceFactory":
+        """
+        Pooled factory for resource, reused while someone holds it so that
+        its cached properties survive across call sites.
+        Only shared for the very same resource object: a partial and a
+        fetched resource with the same id get their own factories.
+
+        Args:
+            resource (DeezerResource): resource to wrap
+
+        Returns:
+            (ResourceFactory) wrapping resource
+        """
+        key = (type(resource), resource.id)
+        with _factory_pool_lock:
+            factory_ = _factory_pool.get(key)
+            if factory_ is None or factory_.resource is not resource:
+                factory_ = _factory_pool[key] = cls(resource=resource)
+        return factory_
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(resource={self.resource!r})"
 
     def __hash__(self):
         return self.resource.id
 
     def __eq__(self, other):
+        if not isinstance(other, ResourceFactory):
+            return NotImplemented
         return self.resource.id == other.resource.id
 
     def to_type(self, target_type: ValidItem) -> List[DeezerResource]:
@@ -83,12 +314,8 @@ class ResourceFactory(BaseModel):
         Returns:
             (List[DeezerResource]) from self.resource
         """
-        if target_type == ValidItem.ALBUM:
-            return [self._album]
-        if target_type == ValidItem.ARTIST:
-            return self._artists
-        if target_type == ValidItem.TRACK:
-            return [self._track]
+        if getter := TO_TYPE_GETTERS.get(target_type):
+            return getter(self)
         raise NotImplementedError(
             "[ResourceFactory.to_type]"
             f" Target type {target_type.value} not supported"
@@ -104,31 +331,13 @@ class ResourceFactory(BaseModel):
         Returns:
             label as string
         """
-        if self.resource.type == target_type.value:
+        if self.resource.type == target_type:
             return self.label
 
-        if target_type == ValidItem.ALBUM:
-            if isinstance(self.resource, deezer.Artist):
-                # first album name
-                return ResourceFactory(
-                    resource=self.resource.get_albums(limit=1)[0]
-                ).label
-            if isinstance(self.resource, deezer.Track):
-                return ResourceFactory(resource=self.resource.album).label
-
-        if target_type == ValidItem.ARTIST:
-            if isinstance(self.resource, deezer.Album):
-                return ResourceFactory(resource=self.resource.artist).label
-            if isinstance(self.resource, deezer.Track):
-                return ResourceFactory(resource=self.resource.artist).label
-
-        if target_type == ValidItem.TRACK:
-            if isinstance(self.resource, deezer.Album):
-                return ResourceFactory(resource=self.resource.tracks[0]).label
-            if isinstance(self.resource, deezer.Artist):
-                return ResourceFactory(
-                    resource=self.resource.get_top(limit=1)[0]
-                ).label
+        source_key = (type(self.resource), target_type)
+        if getter := TARGET_RESOURCE_GETTERS.get(source_key):
+            target = getter(self.resource)
+            return LABEL_GETTERS[type(target)](target)
 
         raise NotImplementedError(
             "[ResourceFactory.get_target_label]"
@@ -136,52 +345,44 @@ class ResourceFactory(BaseModel):
             f" for resource of type {self.resource.type}"
         )
 
-    @property
+    @cached_property
     def label(self) -> str:
-        if isinstance(self.resource, deezer.Artist):
-            return self.resource.name
-        if isinstance(self.resource, deezer.Album | deezer.Track):
-            return self.resource.title
+        if getter := LABEL_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         raise NotImplementedError(
             "[ResourceFactory.label]"
             f" {self.resource.__class__} not supported for label property"
         )
 
-    @property
+    @cached_property
     def full_name(self):
         name = self.label
+        if isinstance(self.resource, deezer.Artist):
+            return name
+        as_dict_ = self._as_dict  # single serialization for all reads
+        artist_names = [
+            as_dict_["artist"]["name"]
+        ]  # [c.name for c in self.resource.contributors]
         if isinstance(self.resource, deezer.Album):
-            artist_names = [
-                self.resource.as_dict()["artist"]["name"]
-            ]  # [c.name for c in self.resource.contributors]
             return f"{name} {' '.join(artist_names)}"
         if isinstance(self.resource, deezer.Track):
-            artist_names = [
-                self.resource.as_dict()["artist"]["name"]
-            ]  # [c.name for c in self.resource.contributors]
-            album_name = self.resource.as_dict()["album"]["title"]
+            album_name = as_dict_["album"]["title"]
             return f"{name} {' '.join(artist_names)} {album_name}"
-        return name  # Artist
+        return name
 
-    @property
+    @cached_property
     def title(self) -> str:
-        if isinstance(self.resource, deezer.Artist):
-            return self._artist_title
-        if isinstance(self.resource, deezer.Album):
-            return self._album_title
-        if isinstance(self.resource, deezer.Track):
-            return self._track_title
+        if getter := TITLE_GETTERS.get(type(self.resource)):
+            return getter(self)
         raise NotImplementedError(
             "[ResourceFactory.title]"
             f" {self.resource.__class__} not supported for title property"
         )
 
-    @property
-    def artist_ids(self) -> Tuple[int]:
-        if isinstance(self.resource, deezer.Artist):
-            return (self.resource.id,)
-        if isinstance(self.resource, deezer.Album | deezer.Track):
-            return tuple(a["id"] for a in self.resource.as_dict()["contributors"])  # type: ignore
+    @cached_property
+    def artist_ids(self) -> Tuple[int, ...]:
+        if getter := ARTIST_IDS_GETTERS.get(type(self.resource)):
+            return getter(self)
         raise NotImplementedError(
             "[ResourceFactory.artist_ids]"
             f" {self.resource.__class__} not supported for artist_ids property"
@@ -209,39 +410,29 @@ class ResourceFactory(BaseModel):
             }
             for artist, weight in zip(
                 current_artists[:limit],
-                scale_weights(
-                    [1] * min(len(current_artists), limit), target_sum=limit
-                ),
+                _uniform_weights(min(len(current_artists), limit), limit),
             )
         ]
-        found = []
-        for params in per_artist:
-            if params["limit"] < 1:
-                continue
-            if target_type == ValidItem.ALBUM:
-                all_albums = list(params["artist"].get_albums())
-                found.extend(
-                    random.sample(all_albums, params["limit"])
-                    if params["limit"] < len(all_albums)
-                    else all_albums
-                )
-            elif target_type == ValidItem.TRACK:
-                try:
-                    radio_tracks = list(
-                        params["artist"].get_top()
-                    )  # fixMe: get_radio has a bug. it gives the calling artist as the artist
-                except DeezerErrorResponse:
-                    continue
-                found.extend(
-                    random.sample(radio_tracks, params["limit"])
-                    if params["limit"] < len(radio_tracks)
-                    else radio_tracks
-                )
-            else:
-                raise NotImplementedError(
-                    "[ResourceFactory.dive]"
-                    f" {target_type.value} not supported as a target type"
-                )
+        if (relation := DIVE_RELATIONS.get(target_type)) is None:
+            raise NotImplementedError(
+                "[ResourceFactory.dive]"
+                f" {target_type.value} not supported as a target type"
+            )
+        per_artist = [params for params in per_artist if params["limit"] >= 1]
+        # one independent http call per artist
+        fetched = _FETCH_POOL.map(
+            lambda params: _dive_candidates(
+                params["artist"], relation, limit=params["limit"]
+            ),
+            per_artist,
+        )
+        found: List[DeezerResource] = []
+        for params, candidates in zip(per_artist, fetched):
+            found.extend(
+                random.sample(candidates, params["limit"])
+                if params["limit"] < len(candidates)
+                else candidates
+            )
         return tuple(found)  # type: ignore
 
     def explore(
@@ -258,15 +449,21 @@ class ResourceFactory(BaseModel):
         """
         current_artists = self._artists
         if target_type == ValidItem.ARTIST:
-            all_related = set(
-                [
-                    related_artist
-                    for artist in current_artists
-                    for related_artist in artist.get_related()
-                ]
+            # deduplicated by id, resources only hash by identity
+            related_by_id: Dict[int, DeezerResource] = {}
+            for related_artist in chain.from_iterable(
+                _FETCH_POOL.map(
+                    lambda artist: _artist_relation(
+                        artist, "related", window=limit
+                    ),
+                    current_artists,
+                )
+            ):
+                related_by_id.setdefault(related_artist.id, related_artist)
+            all_related = list(related_by_id.values())
+            return tuple(  # type: ignore
+                random.sample(all_related, min(limit, len(all_related)))
             )
-            # set order will randomize itself
-            return tuple(list(all_related)[:limit])  # type: ignore
 
         per_artist = [
             {
@@ -275,111 +472,114 @@ class ResourceFactory(BaseModel):
             }
             for artist, weight in zip(
                 current_artists[:limit],
-                scale_weights(
-                    [1] * min(len(current_artists), limit), target_sum=limit
-                ),
+                _uniform_weights(min(len(current_artists), limit), limit),
             )
         ]
         related_items = [
-            ResourceFactory(resource=params["artist"]).dive(
+            ResourceFactory.factory_for(params["artist"]).dive(
                 target_type=target_type, limit=params["limit"]
             )
             for params in per_artist
         ]
-        return tuple(  # type: ignore
-            item_ for items_ in related_items for item_ in items_
-        )
+        return tuple(chain.from_iterable(related_items))  # type: ignore
 
-    @property
+    @cached_property
     def _album(self) -> deezer.Album:
-        if isinstance(self.resource, deezer.Album):
-            return self.resource
-        if isinstance(self.resource, deezer.Track):
-            return self.resource.album.get()
-        if isinstance(self.resource, deezer.Artist):
-            return self.resource.get_albums()[0]
+        if getter := ALBUM_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         raise NotImplementedError(
             "[ResourceFactory._album]"
             f" {self.resource.__class__} not supported for artist_ids property"
         )
 
-    @property
+    @cached_property
     def _track(self):
-        if isinstance(self.resource, deezer.Track):
-            return self.resource
-        if isinstance(self.resource, deezer.Album):
-            return self.resource.get_tracks()[0]
-        if isinstance(self.resource, deezer.Artist):
-            return self.resource.get_top()[0]
+        if getter := TRACK_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         raise NotImplementedError(
             "[ResourceFactory._track]"
             f" {self.resource.__class__} not supported for artist_ids property"
         )
 
-    @property
+    @cached_property
     def _artists(self) -> List[deezer.Artist]:
-        if isinstance(self.resource, deezer.Artist):
-            return [self.resource]
-        if isinstance(self.resource, deezer.Album | deezer.Track):
-            return [a.get() for a in self.resource.contributors]
+        if getter := ARTISTS_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         raise NotImplementedError(
             "[ResourceFactory.artists]"
             f" {self.resource.__class__} not supported for artist_ids property"
         )
 
-    @property
+    @cached_property
+    def _as_dict(self) -> Dict[str, Any]:
+        return self.resource.as_dict()
+
+    @cached_property
     def preview_url(self) -> str | None:
-        if isinstance(self.resource, deezer.Track):
-            return self.resource.preview
+        if getter := PREVIEW_URL_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         return None
 
-    @property
+    @cached_property
     def image(self) -> str | None:
-        if isinstance(self.resource, deezer.Artist):
-            return self.resource.picture_medium
-        if isinstance(self.resource, deezer.Album):
-            return self.resource.cover_medium
-        if isinstance(self.resource, deezer.Track):
-            return None  # no image for tracks
+        if getter := IMAGE_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         raise NotImplementedError(
             "[ResourceFactory.image]"
             f" {self.resource.__class__} not supported for image property"
         )
 
-    @property
-    def popularity_indicator(self) -> int:
-        if isinstance(self.resource, deezer.Track):
-            return self.resource.rank
-        if isinstance(self.resource, deezer.Artist):
-            return self.resource.nb_fan
-        if isinstance(self.resource, deezer.Album):
-            return self.resource.fans
+    @cached_property
+    def node_shape(self) -> str:
+        return "circularImage" if self.image else "dot"
 
+    @cached_property
+    def popularity_indicator(self) -> int:
+        if getter := POPULARITY_INDICATOR_GETTERS.get(type(self.resource)):
+            return getter(self.resource)
         raise NotImplementedError(
             "[ResourceFactory.popularity_indicator]"
             f" {self.resource.__class__} not supported for popularity property"
         )
 
     @property
-    def popularity_upper(self):
-        return POPULARITY_UPPERS[self.resource.type]
+    def popularity_upper(self) -> int:
+        return POPULARITY_BOUNDS[type(self.resource)][1]
 
-    @property
-    def popularity_distance(self) -> int:
-        return self.popularity_indicator - self.popularity_threshold
-
-    @property
+    @cached_property
     def popularity(
         self,
     ) -> int:  # fixMe - not very contrasted, add some kind of log function for artist
-        """is a percent"""
-        return int(
-            sqrt(self.popularity_indicator / self.popularity_upper) * 100
+        """is a percent, floor(sqrt(indicator / upper) * 100) in int math"""
+        return isqrt(
+            self.popularity_indicator * 10000 // self.popularity_upper
         )
 
+    @staticmethod
+    def popularity_batch(
+        indicators: np.ndarray, uppers: np.ndarray
+    ) -> np.ndarray:
+        """
+        Vectorized popularity for many resources at once, same integer
+        results as the popularity property
+
+        Args:
+            indicators (np.ndarray): popularity_indicator of each resource
+            uppers (np.ndarray): popularity_upper of each resource
+
+        Returns:
+            (np.ndarray) popularity percents as ints
+        """
+        scaled = np.asarray(indicators, dtype=np.int64) * 10000 // uppers
+        root = np.sqrt(scaled).astype(np.int64)
+        # float sqrt can be off by one around perfect squares, fix to isqrt
+        root -= root * root > scaled
+        root += (root + 1) * (root + 1) <= scaled
+        return root
+
     @property
     def popularity_threshold(self) -> int:
-        return POPULARITY_THRESHOLDS[self.resource.type]
+        return POPULARITY_BOUNDS[type(self.resource)][0]
 
     @property
     def node_color(self) -> str:
@@ -0,0 +1,110 @@
+"""
+Items cache shared by the workers of a deployment
+
+Contains:
+    - sqlite backed store of deezer items as json, rebuilt on read
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+import deezer  # type: ignore
+from items.item import DeezerResource, ValidItem
+
+# deezer type -> resource class, nested items of these types are rebuilt too
+RESOURCE_CLASSES: Dict[str, type] = {
+    ValidItem.ALBUM.value: deezer.Album,
+    ValidItem.ARTIST.value: deezer.Artist,
+    ValidItem.TRACK.value: deezer.Track,
+}
+
+
+class SharedItemsCache:
+    def __init__(self, path: str | Path, client: deezer.Client):
+        """
+        path: sqlite file, shared by every worker process
+        client: deezer client rebuilt resources are bound to
+
+        Items are keyed by (type, id), deezer ids are unique per type only.
+        One connection per thread, sqlite handles cross-process locking.
+        """
+        self._path = str(path)
+        self._client = client
+        self._local = threading.local()
+        with self._connection() as connection_:
+            connection_.execute("PRAGMA journal_mode=WAL")
+            connection_.execute(
+                "CREATE TABLE IF NOT EXISTS resources"
+                " (type TEXT NOT NULL, id INTEGER NOT NULL,"
+                " data TEXT NOT NULL, PRIMARY KEY (type, id))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection_ = getattr(self._local, "connection", None)
+        if connection_ is None:
+            connection_ = sqlite3.connect(self._path, timeout=10)
+            self._local.connection = connection_
+        return connection_
+
+    def _rebuild(self, data: Dict[str, Any]) -> Any:
+        """
+        Resource of a dict from as_dict, nested resources (artist, album...)
+        included. Contributors are parsed by the resource itself.
+        """
+        fields = {
+            key: (
+                self._rebuild(value)
+                if isinstance(value, dict)
+                and value.get("type") in RESOURCE_CLASSES
+                else value
+            )
+            for key, value in data.items()
+        }
+        return RESOURCE_CLASSES[data["type"]](self._client, fields)
+
+    def put_many(self, items_: Iterable[DeezerResource]):
+        """
+        Insert or refresh items, in a single transaction
+
+        Args:
+            items_ (Iterable[DeezerResource]): items to share
+        """
+        rows = [
+            (item_.type, item_.id, json.dumps(item_.as_dict()))
+            for item_ in items_
+            if item_.type in RESOURCE_CLASSES
+        ]
+        if not rows:
+            return
+        with self._connection() as connection_:
+            connection_.executemany(
+                "INSERT OR REPLACE INTO resources (type, id, data)"
+                " VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def get(self, item_type: str, item_id: int) -> DeezerResource | None:
+        """
+        Get item shared by any worker
+
+        Args:
+            item_type (str): deezer item type
+            item_id (int): deezer item id
+
+        Returns:
+            rebuilt item, None if not shared
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT data FROM resources WHERE type = ? AND id = ?",
+                (item_type, item_id),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return self._rebuild(json.loads(row[0]))
@@ -6,65 +6,198 @@ Contains:
     - graphs for each query
 """
 
-from typing import Dict, List, Optional, Set
+import threading
+import weakref
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from itertools import chain, count
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import commons
 import config
 import constants
 import networkx as nx  # type: ignore
+import numpy as np
+from api_clients import deezer_client
 from commons.metaclasses import ThreadSafeSingleton
 from items.item import DeezerResource, ResourceFactory
+from items.shared_cache import SharedItemsCache
 from status import StatusManager
 
+# depth 1 (or less), 2, 3 and more
+DEPTH_NODE_SIZES = (50, 30, 20)
+# popularity up to 50, more popular nodes are capped to the last size
+POPULARITY_NODE_SIZES = tuple(15 if p <= 20 else p for p in range(51))
+# graphs from this size walk their csr adjacency with numpy, if enabled
+VECTORIZED_BFS_MIN_NODES = 10000
+# graph write locks, power of 2
+SESSION_LOCK_STRIPES = 16
+
 
 class ItemStore(metaclass=ThreadSafeSingleton):
     def __init__(self):
         """
-        _items: cache for DeezerItem, key is spotify foreign item id
+        _items: cache for DeezerItem, key is deezer item id.
+                LRU bounded by config.ITEMS_CACHE_SIZE
+        _items_pinned: factories of the items of each (session, graph_key)
+                       graph, kept alive as long as they are nodes of it.
+                       LRU of graphs bounded by config.PINNED_GRAPHS_SIZE
+        _items_weak: every item still referenced, evicted or not
+        _shared_items: cache shared across workers, behind the in-process
+                       ones, looked up by type. Only if
+                       SHARED_ITEMS_CACHE_PATH
         _graphs: per session, per graph_key
+        _graph_keys: graph keys of all sessions, graphs are never dropped
+        _edge_pairs: count of edges per unordered {u, v} pair, per graph
+        _expanded: nodes already expanded, per graph
+        _csr: packed adjacency per (session, graph_key, reverse), tagged with
+              the graph version it was built from. Only if CSR_ADJACENCY
+
+        Readers (get, get_graph, successors...) take no lock, single dict
+        reads are atomic under the GIL. _items LRU writes are locked and
+        graph writes take the lock stripe of their session only.
         """
-        self._items: Dict[int, DeezerResource] = {}
+        self._items: OrderedDict[int, DeezerResource] = OrderedDict()
+        self._items_lock = threading.Lock()
+        self._session_locks = tuple(
+            threading.RLock() for _ in range(SESSION_LOCK_STRIPES)
+        )
+        self._items_pinned: OrderedDict[
+            Tuple[str, str], Dict[int, ResourceFactory]
+        ] = OrderedDict()
+        self._pinned_lock = threading.Lock()
+        self._items_weak: weakref.WeakValueDictionary[int, DeezerResource]
+        self._items_weak = weakref.WeakValueDictionary()
+        self._shared_items: Optional[SharedItemsCache] = None
+        if config.SHARED_ITEMS_CACHE_PATH:
+            self._shared_items = SharedItemsCache(
+                config.SHARED_ITEMS_CACHE_PATH, client=deezer_client
+            )
         self._graphs: Dict[str, Dict[str, nx.DiGraph]] = dict()
+        self._graph_keys: Set[str] = set()
+        self._edge_pairs: Dict[Tuple[str, str], Counter] = {}
+        self._expanded: Dict[Tuple[str, str], Set[int]] = {}
+        self._csr: Dict[Tuple[str, str, bool], Tuple[Any, ...]] = {}
+        self._graph_versions: Dict[Tuple[str, str], int] = {}
+        self._versions = count()
 
     @property
     def session_ids(self) -> Set[str]:
-        return set(self._graphs.keys())
+        return set(self._graphs)
 
     @property
     def graph_keys(self) -> Set[str]:
-        return set(
-            sum(
-                [
-                    list(session_graphs.keys())
-                    for session_graphs in self._graphs.values()
-                ],
-                [],
-            )
-        )
+        return set(self._graph_keys)
 
     @staticmethod
     def _depth_node_size(depth: int):
-        if depth <= 1:
-            return 50
-        if depth == 2:
-            return 30
-        return 20
+        return DEPTH_NODE_SIZES[min(max(depth, 1), 3) - 1]
 
     @staticmethod
     def _popularity_node_size(popularity: Optional[int] = None):
-        if popularity is None or popularity <= 20:
+        if popularity is None:
             return 15
-        return min(popularity, 50)
+        return POPULARITY_NODE_SIZES[min(max(popularity, 0), 50)]
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _graph_key_cached(keywords: Tuple[str, ...]) -> str:
+        return commons.values_to_str(list(keywords), "+")
 
     @staticmethod
     def graph_key_from_keywords(keywords: List[str]):
-        return commons.values_to_str(keywords, "+")
+        if isinstance(keywords, str):
+            return keywords
+        return ItemStore._graph_key_cached(tuple(keywords))
 
-    def get(self, item_id: int) -> DeezerResource | None:
-        return self._items.get(item_id)
+    def get(
+        self, item_id: int, item_type: Optional[str] = None
+    ) -> DeezerResource | None:
+        """
+        Get a cached item
+
+        Args:
+            item_id (int): deezer item id
+            item_type (str): deezer item type, to look up the shared cache
+
+        Returns:
+            the item, None if not cached
+        """
+        item_ = self._items.get(item_id)
+        if item_ is None:
+            item_ = self._items_weak.get(item_id)
+        if (
+            item_ is None
+            and item_type is not None
+            and self._shared_items is not None
+        ):
+            item_ = self._shared_items.get(item_type, item_id)
+            if item_ is not None:
+                self._items_weak[item_id] = item_
+        return item_
+
+    def get_all_items(self) -> Dict[int, DeezerResource]:
+        return dict(self._items_weak.items())
+
+    def _cache_item(self, item: DeezerResource):
+        """
+        Add or refresh item in the LRU items cache
 
-    def get_all_items(self):
-        return self._items
+        Args:
+            item (DeezerResource): item to cache
+        """
+        self._items_weak[item.id] = item
+        with self._items_lock:
+            if item.id in self._items:
+                self._items.move_to_end(item.id)
+                return
+            self._items[item.id] = item
+            if len(self._items) > config.ITEMS_CACHE_SIZE:
+                self._items.popitem(last=False)
+
+    def _pin(
+        self,
+        session_id: str,
+        graph_key: str,
+        factories: Iterable[ResourceFactory],
+        replace: bool = False,
+    ):
+        """
+        Keep factories alive as items of a graph, see _items_pinned
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph of the items
+            factories (Iterable[ResourceFactory]): factories of the items
+            replace (bool): whether to release the graph's other items
+        """
+        key = (session_id, graph_key)
+        with self._pinned_lock:
+            pinned_ = None if replace else self._items_pinned.get(key)
+            if pinned_ is None:
+                pinned_ = self._items_pinned[key] = {}
+            self._items_pinned.move_to_end(key)
+            for factory_ in factories:
+                pinned_[factory_.resource.id] = factory_
+            while len(self._items_pinned) > config.PINNED_GRAPHS_SIZE:
+                self._items_pinned.popitem(last=False)
+
+    def _unpin(
+        self,
+        session_id: str,
+        graph_key: str,
+        nodes_ids: Optional[Iterable[int]] = None,
+    ):
+        """
+        Release items of a graph, all of them if nodes_ids is None
+        """
+        key = (session_id, graph_key)
+        with self._pinned_lock:
+            if nodes_ids is None:
+                self._items_pinned.pop(key, None)
+            elif (pinned_ := self._items_pinned.get(key)) is not None:
+                for node_id in nodes_ids:
+                    pinned_.pop(node_id, None)
 
     def get_graphs(self, session_id: str) -> Optional[Dict[str, nx.DiGraph]]:
         """
@@ -82,6 +215,135 @@ class ItemStore(metaclass=ThreadSafeSingleton):
     ) -> Optional[nx.DiGraph]:
         return self._graphs.get(session_id, {}).get(graph_key)
 
+    def snapshot_graph(
+        self,
+        session_id: str,
+        graph_key: str,
+        system_: str = constants.VIS_JS_SYS,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Nodes and edges of a graph as lists of dicts, serialized at once
+        under the session lock so no concurrent write lands in between
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph to serialize
+            system_ (str): 'python' or 'vis.js' serialization api keys
+
+        Returns:
+            {'nodes': [...], 'edges': [...]}, both empty if no such graph
+        """
+        graph_ = self.get_graph(session_id=session_id, graph_key=graph_key)
+        if graph_ is None:
+            return {constants.NODES: [], constants.EDGES: []}
+        with self._session_lock(session_id):
+            return commons.graph_to_dict(graph_, system_=system_)
+
+    def copy_graph(
+        self, session_id: str, graph_key: str
+    ) -> Optional[nx.DiGraph]:
+        """
+        Copy of a graph taken under the session lock, detached from writers
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph to copy
+
+        Returns:
+            the copy, None if no such graph
+        """
+        graph_ = self.get_graph(session_id=session_id, graph_key=graph_key)
+        if graph_ is None:
+            return None
+        with self._session_lock(session_id):
+            return graph_.copy()
+
+    def _graph_written(self, session_id: str, graph_key: str):
+        """
+        Mark graph as modified, packed adjacencies built before are stale
+        """
+        if config.CSR_ADJACENCY:
+            self._graph_versions[(session_id, graph_key)] = next(
+                self._versions
+            )
+
+    def _csr_for(
+        self,
+        session_id: str,
+        graph_key: str,
+        graph: nx.DiGraph,
+        reverse: bool = False,
+    ) -> Tuple[Dict[int, int], np.ndarray, tuple, np.ndarray, tuple]:
+        """
+        Packed adjacency of a graph, rebuilt if written since last built
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph
+            graph (nx.DiGraph): the session graph
+            reverse (bool): whether to pack predecessors
+
+        Returns:
+            (index, offsets, neighbors, indices, nodes by row)
+        """
+        version = self._graph_versions.get((session_id, graph_key))
+        csr_ = self._csr.get((session_id, graph_key, reverse))
+        if csr_ is None or csr_[0] != version:
+            index, *arrays = commons.csr_adjacency(graph, reverse=reverse)
+            csr_ = (version, index, *arrays, tuple(index))
+            self._csr[(session_id, graph_key, reverse)] = csr_
+        return csr_[1:]
+
+    def _neighbors(
+        self,
+        session_id: str,
+        graph_key: str,
+        graph: nx.DiGraph,
+        node_id: int,
+        reverse: bool = False,
+    ) -> Iterable[int]:
+        """
+        Successors (predecessors if reverse) of a node
+        Sliced from the packed adjacency if CSR_ADJACENCY, rebuilt if stale
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph
+            graph (nx.DiGraph): the session graph
+            node_id (int): node identifier, must be in graph
+            reverse (bool): whether to get predecessors
+
+        Returns:
+            neighbors ids
+        """
+        if not config.CSR_ADJACENCY:
+            if reverse:
+                return graph.predecessors(n=node_id)
+            return graph.successors(n=node_id)
+
+        index, offsets, neighbors, _, _ = self._csr_for(
+            session_id, graph_key, graph, reverse=reverse
+        )
+        i = index.get(node_id)
+        if i is None:  # added after the last write was marked
+            return graph.pred[node_id] if reverse else graph.succ[node_id]
+        return neighbors[offsets[i] : offsets[i + 1]]
+
+    def _session_lock(self, session_id: str) -> threading.RLock:
+        """
+        Write lock of a session, striped so that memory does not grow with
+        sessions. Writers of sessions on other stripes don't contend
+
+        Args:
+            session_id (str): user session identifier
+
+        Returns:
+            the lock stripe of the session
+        """
+        return self._session_locks[
+            hash(session_id) & (SESSION_LOCK_STRIPES - 1)
+        ]
+
     def init_session(self, session_id: str):
         """
         Initialize graph for a session
@@ -89,22 +351,32 @@ class ItemStore(metaclass=ThreadSafeSingleton):
         Args:
             session_id (str): uuid4
         """
-        if self._graphs.get(session_id) is not None:
-            return
-        self._graphs[session_id] = {}
+        self._graphs.setdefault(session_id, {})
 
-    def init_graph(self, session_id: str, graph_key: str):
+    def init_graph(self, session_id: str, graph_key: str) -> nx.DiGraph:
         """
         Initialize graph for a session
 
         Args:
             session_id (str): uuid4
             graph_key (str): id of query node
+
+        Returns:
+            the session graph, existing or new
         """
-        self.init_session(session_id=session_id)
-        if self._graphs[session_id].get(graph_key) is not None:
-            return
-        self._graphs[session_id][graph_key] = nx.DiGraph()
+        session_graphs = self._graphs.get(session_id)
+        if session_graphs is None:
+            session_graphs = self._graphs.setdefault(session_id, {})
+        graph_ = session_graphs.get(graph_key)
+        if graph_ is not None:
+            return graph_
+        with self._session_lock(session_id):
+            graph_ = session_graphs.get(graph_key)
+            if graph_ is None:
+                graph_ = session_graphs[graph_key] = nx.DiGraph()
+                self._graph_keys.add(graph_key)
+                self._graph_written(session_id, graph_key)
+        return graph_
 
     def delete_nodes(
         self, session_id: str, graph_key: str, nodes_ids: List[int]
@@ -117,55 +389,119 @@ class ItemStore(metaclass=ThreadSafeSingleton):
             graph_key (str): id of the graph to add item to
             nodes_ids (List[str]): list of nodes id to delete
         """
-        if self.get_graph(session_id=session_id, graph_key=graph_key) is None:
+        graph_ = self.get_graph(session_id=session_id, graph_key=graph_key)
+        if graph_ is None:
             return
-        self._graphs[session_id][graph_key].remove_nodes_from(nodes_ids)
+        with self._session_lock(session_id):
+            # present nodes only, once each
+            nodes_ids_ = {
+                node_id for node_id in nodes_ids if node_id in graph_
+            }
+            if not nodes_ids_:
+                return
+            edge_pairs = self._edge_pairs.get((session_id, graph_key))
+            if edge_pairs is not None:
+                # once per edge, even if both ends are deleted
+                removed_ = {
+                    (u, v): frozenset((u, v))
+                    for u, v in chain(
+                        graph_.out_edges(nodes_ids_),
+                        graph_.in_edges(nodes_ids_),
+                    )
+                }
+                edge_pairs.subtract(removed_.values())
+                for pair_ in removed_.values():
+                    if edge_pairs[pair_] <= 0:
+                        del edge_pairs[pair_]
+            if expanded_ := self._expanded.get((session_id, graph_key)):
+                # parents of deleted nodes can be expanded again
+                expanded_.difference_update(nodes_ids_)
+                expanded_.difference_update(
+                    u for u, _ in graph_.in_edges(nodes_ids_)
+                )
+            graph_.remove_nodes_from(nodes_ids_)
+            self._unpin(session_id, graph_key, nodes_ids=nodes_ids_)
+            self._graph_written(session_id, graph_key)
+
+    def is_expanded(
+        self, session_id: str, graph_key: str, node_id: int
+    ) -> bool:
+        """
+        Whether the node was expanded and none of its children deleted since
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph of the node
+            node_id (int): expanded node id
+
+        Returns:
+            (bool)
+        """
+        return node_id in self._expanded.get((session_id, graph_key), ())
+
+    def mark_expanded(self, session_id: str, graph_key: str, node_id: int):
+        """
+        Remember the node was expanded, see is_expanded
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph of the node
+            node_id (int): expanded node id
+        """
+        with self._session_lock(session_id):
+            self._expanded.setdefault((session_id, graph_key), set()).add(
+                node_id
+            )
 
-    def _add_node(
+    def _node_attributes(
         self,
-        session_id: str,
         graph_key: str,
         item: DeezerResource,
         depth: int = 3,
         color: Optional[str] = None,
+        factory_: Optional[ResourceFactory] = None,
+        popularity: Optional[int] = None,
         **kwargs,
-    ):
+    ) -> Dict[str, Any]:
         """
-        Add node to the graph
+        Build node attributes of an item, to be added to the graph
 
         Args:
-            session_id (str): user session identifier
             graph_key (str): id of the graph to add item to
             item (DeezerResource): parsed item
             selected_types (list): item types to add to node
             depth (int): for size styling
             color (str): node color, if None will be item.node_color
+            factory_ (ResourceFactory): wrapper of item, built if None
+            popularity (int): precomputed factory_.popularity, optional
+
+        Returns:
+            node attributes
         """
 
-        # Because Vis JS error if present
-        optional_kwargs = {}
-        factory_ = ResourceFactory(resource=item)
-        if factory_.image:
-            optional_kwargs["image"] = factory_.image
-
-        # Add node to graph
-        self._graphs[session_id][graph_key].add_node(
-            item.id,
-            label=factory_.label,
-            title=factory_.title,
-            size=self._popularity_node_size(factory_.popularity),
-            color=color or factory_.node_color,  # todo: Deezer
-            shape="dot" if not factory_.image else "circularImage",
-            href=item.link or "_blank",
-            preview_url=factory_.preview_url,
-            expand_enabled=depth > 0,
-            graph_key=graph_key,
-            node_type=item.type,
-            depth=depth,
-            **optional_kwargs,
+        if factory_ is None:
+            factory_ = ResourceFactory.factory_for(item)
+        if popularity is None:
+            popularity = factory_.popularity
+        attrs = {
+            "label": factory_.label,
+            "title": factory_.title,
+            "size": self._popularity_node_size(popularity),
+            "color": color or factory_.node_color,  # todo: Deezer
+            "shape": factory_.node_shape,
+            "href": item.link or "_blank",
+            "preview_url": factory_.preview_url,
+            "expand_enabled": depth > 0,
+            "graph_key": graph_key,
+            "node_type": item.type,
+            "depth": depth,
             **kwargs,
-            # font="10px arial white",
-        )
+            # "font": "10px arial white",
+        }
+        # Because Vis JS error if present
+        if image := factory_.image:
+            attrs["image"] = image
+        return attrs
 
     def set_query_node(
         self,
@@ -187,24 +523,37 @@ class ItemStore(metaclass=ThreadSafeSingleton):
             Graph key
         """
         query_key = ItemStore.graph_key_from_keywords(query_kw)
-        if self._graphs.get(session_id, {}).get(query_key):
-            if not override:
-                return query_key
-            self._graphs[session_id][query_key] = nx.DiGraph()
-        self.init_graph(session_id=session_id, graph_key=query_key)
-        self._graphs[session_id][query_key].add_node(
-            hash(query_key),
-            label=commons.values_to_str(query_kw, sep=" "),
-            title="Query",
-            size=50,
-            color=config.NodeColor.PRIMARY.value,
-            shape="circle",
-            href=f"https://open.spotify.com/search/{'%20'.join(query_kw)}",
-            task_id=task_id,
-            graph_key=query_key,
-            node_type="query",
-            **kwargs,
-        )
+        session_graphs = self._graphs.setdefault(session_id, {})
+        if not override and session_graphs.get(query_key):
+            return query_key  # existing and not empty, no lock nor label
+        label = commons.values_to_str(query_kw, sep=" ")
+        url_query = label.replace(" ", "%20")
+        with self._session_lock(session_id):
+            graph_ = session_graphs.get(query_key)
+            if graph_:  # existing and not empty
+                if not override:
+                    return query_key
+                graph_ = None
+                self._unpin(session_id, query_key)
+                self._edge_pairs.pop((session_id, query_key), None)
+                self._expanded.pop((session_id, query_key), None)
+            if graph_ is None:
+                graph_ = session_graphs[query_key] = nx.DiGraph()
+                self._graph_keys.add(query_key)
+            graph_.add_node(
+                hash(query_key),
+                label=label,
+                title="Query",
+                size=50,
+                color=config.NodeColor.PRIMARY.value,
+                shape="circle",
+                href=f"https://open.spotify.com/search/{url_query}",
+                task_id=task_id,
+                graph_key=query_key,
+                node_type="query",
+                **kwargs,
+            )
+            self._graph_written(session_id, query_key)
         return query_key
 
     def add_nodes(
@@ -226,34 +575,65 @@ class ItemStore(metaclass=ThreadSafeSingleton):
             depth (int): for styling when adding to the graph
             task_id (str): if provided, set intermediate results to task
         """
-        self.init_graph(session_id=session_id, graph_key=graph_key)
-        graph_ = self.get_graph(session_id=session_id, graph_key=graph_key)
-        assert graph_ is not None, "Graph not in session"
+        graph_ = self.init_graph(session_id=session_id, graph_key=graph_key)
 
+        # items may fetch from deezer while styled, out of the session lock
+        # networkx node -> attributes dict, one probe without NodeView
+        nodes_data = graph_._node
+        new_items: Dict[int, DeezerResource] = {}
         for item_ in items_:
-            if item_.id not in self._items:
-                self._items[item_.id] = item_
-            if not graph_.nodes.get(item_.id):
-                self._add_node(
-                    session_id=session_id,
+            item_id = item_.id
+            self._cache_item(item_)
+            # nodes created by an edge only have no attributes, style them
+            if not nodes_data.get(item_id):
+                new_items.setdefault(item_id, item_)
+        if self._shared_items is not None:
+            self._shared_items.put_many(new_items.values())
+
+        factories = [
+            ResourceFactory.factory_for(item_) for item_ in new_items.values()
+        ]
+        popularities = ResourceFactory.popularity_batch(
+            np.array([f.popularity_indicator for f in factories]),
+            np.array([f.popularity_upper for f in factories]),
+        )
+        nodes_ = [
+            (
+                factory_.resource.id,
+                self._node_attributes(
                     graph_key=graph_key,
-                    item=item_,
+                    item=factory_.resource,
                     depth=depth,
+                    factory_=factory_,
+                    popularity=popularity,
                     **kwargs,
-                )
-        if task_id is not None:
-            self.__add_nodes_edges_to_task(
-                session_id=session_id,
-                graph_key=graph_key,
-                task_id=task_id,
+                ),
             )
+            for factory_, popularity in zip(factories, popularities.tolist())
+        ]
+
+        with self._session_lock(session_id):
+            # styled by a concurrent write meanwhile, keep its attributes
+            nodes_ = [
+                node_ for node_ in nodes_ if not nodes_data.get(node_[0])
+            ]
+            self._pin(session_id, graph_key, factories)
+            graph_.add_nodes_from(nodes_)
+            self._graph_written(session_id, graph_key)
+            if task_id is not None:
+                self.__add_nodes_edges_to_task(
+                    session_id=session_id,
+                    graph_key=graph_key,
+                    task_id=task_id,
+                    nodes_ids=[node_id for node_id, _ in nodes_],
+                )
 
     def relate(
         self,
         session_id: str,
-        graph_key: str | int,
+        graph_key: str,
         parent_id: str | int,
-        children_ids: Set[str],
+        children_ids: Iterable[str | int],
         task_id: Optional[str] = None,
         no_doubles: bool = True,
         **kwargs,
@@ -263,41 +643,105 @@ class ItemStore(metaclass=ThreadSafeSingleton):
 
         Args:
             session_id (str): user session identifier
-            graph_key (str | int): id of the graph to relate item in
+            graph_key (str): id of the graph to relate item in
             parent_id (str | int): node id of the parent node to relate item with
-            children_ids (List[str]): list of node ids relate parent item with
+            children_ids (Iterable[str | int]): node ids to relate parent with
             task_id (str): if provided, set intermediate results to task
             no_doubles (bool): whether to prevent double edges between nodes
         """
 
-        exclusion_unordered_ids = set()
-        if no_doubles:
-            exclusion_unordered_ids = {
-                unordered_id
-                for _, _, unordered_id in self._graphs[session_id][
-                    graph_key
-                ].edges(data="unordered_id")
-            }
-        for child_id in children_ids:
-            if (
-                edge_id := commons.commutative_hash(parent_id, child_id)
-            ) in exclusion_unordered_ids:
-                continue  # don't add if there is an existing edge (undirected) and no_doubles
-
-            # children first for color
-            self._graphs[session_id][graph_key].add_edge(
-                parent_id,
-                child_id,
-                width=config.EDGE_WIDTH,
-                id=f"{parent_id}_{child_id}",
-                unordered_id=edge_id,
-                **kwargs,
+        with self._session_lock(session_id):
+            graph_ = self._graphs[session_id][graph_key]
+            edge_pairs = self._edge_pairs.setdefault(
+                (session_id, graph_key), Counter()
             )
+            exclusion_pairs = edge_pairs if no_doubles else ()
+            parent_bytes = commons.commutative_bytes(parent_id)
+            parent_prefix = f"{parent_id}_"
+            edges_ = []
+            new_pairs = []
+            # once each, a repeated child would count its pair twice
+            for child_id in dict.fromkeys(children_ids):
+                if (
+                    pair_ := frozenset((parent_id, child_id))
+                ) in exclusion_pairs:
+                    continue  # don't add if there is an existing edge (undirected) and no_doubles
+                if not graph_.has_edge(parent_id, child_id):
+                    new_pairs.append(pair_)
+
+                # children first for color
+                edges_.append(
+                    (
+                        parent_id,
+                        child_id,
+                        dict(
+                            width=config.EDGE_WIDTH,
+                            id=parent_prefix + str(child_id),
+                            unordered_id=commons.commutative_hash_from(
+                                parent_bytes, child_id
+                            ),
+                            **kwargs,
+                        ),
+                    )
+                )
+            graph_.add_edges_from(edges_)
+            edge_pairs.update(new_pairs)
+            self._graph_written(session_id, graph_key)
+
+            if task_id is not None:
+                # nodes created by the edges are published once styled
+                self.__add_nodes_edges_to_task(
+                    session_id=session_id,
+                    graph_key=graph_key,
+                    task_id=task_id,
+                    edges=[
+                        (parent_id, child_id)
+                        for parent_id, child_id, _ in edges_
+                    ],
+                )
 
-        if task_id is not None:
-            self.__add_nodes_edges_to_task(
-                session_id=session_id, graph_key=graph_key, task_id=task_id
+    def load_graph(
+        self,
+        session_id: str,
+        graph_key: str,
+        graph_: nx.DiGraph,
+        items_: Iterable[DeezerResource],
+        task_id: Optional[str] = None,
+    ):
+        """
+        Replace a session graph with a copy of a previously built one
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph to replace
+            graph_ (nx.DiGraph): graph to copy, its query node is graph_key's
+            items_ (Iterable[DeezerResource]): items of the graph nodes
+            task_id (str): if provided, set the graph as task result
+        """
+        graph_ = graph_.copy()
+        if (query_node := graph_._node.get(hash(graph_key))) is not None:
+            query_node["task_id"] = task_id
+        factories = []
+        for item_ in items_:
+            self._cache_item(item_)
+            factories.append(ResourceFactory.factory_for(item_))
+        with self._session_lock(session_id):
+            self._graphs.setdefault(session_id, {})[graph_key] = graph_
+            self._graph_keys.add(graph_key)
+            self._pin(session_id, graph_key, factories, replace=True)
+            self._edge_pairs[(session_id, graph_key)] = Counter(
+                frozenset(edge_) for edge_ in graph_.edges
             )
+            self._expanded.pop((session_id, graph_key), None)
+            self._graph_written(session_id, graph_key)
+            if task_id is not None:
+                self.__add_nodes_edges_to_task(
+                    session_id=session_id,
+                    graph_key=graph_key,
+                    task_id=task_id,
+                    nodes_ids=list(graph_),
+                    edges=list(graph_.edges),
+                )
 
     def add_and_relate(
         self,
@@ -346,30 +790,12 @@ class ItemStore(metaclass=ThreadSafeSingleton):
             recursive (bool): whether to check for successors' successors
             exclusion_set (Set[str]): to avoid loops when recursive
         """
-        exclusion_set = exclusion_set or set()
-        graph = self.get_graph(session_id=session_id, graph_key=graph_key)
-        if not graph or node_id not in graph.nodes:
-            return set()
-        current = {
-            n for n in graph.successors(n=node_id) if n not in exclusion_set
-        }
-
-        if not recursive:
-            return current
-
-        exclusion_set.add(node_id)
-        exclusion_set = exclusion_set.union(current)
-        return current.union(
-            *(
-                self.get_successors(
-                    session_id=session_id,
-                    graph_key=graph_key,
-                    node_id=s,
-                    recursive=recursive,
-                    exclusion_set=exclusion_set,
-                )
-                for s in current
-            )
+        return self._reachable(
+            session_id=session_id,
+            graph_key=graph_key,
+            node_id=node_id,
+            recursive=recursive,
+            exclusion_set=exclusion_set,
         )
 
     def get_predecessors(
@@ -390,56 +816,180 @@ class ItemStore(metaclass=ThreadSafeSingleton):
             recursive (bool): whether to check for predecessors' predecessors
             exclusion_set (Set[str]): to avoid loops when recursive
         """
+        return self._reachable(
+            session_id=session_id,
+            graph_key=graph_key,
+            node_id=node_id,
+            recursive=recursive,
+            exclusion_set=exclusion_set,
+            reverse=True,
+        )
+
+    def _reachable(
+        self,
+        session_id: str,
+        graph_key: str,
+        node_id: int,
+        recursive: bool = True,
+        exclusion_set: Optional[Set[int]] = None,
+        reverse: bool = False,
+    ) -> Set[int]:
+        """
+        Breadth first walk of successors (predecessors if reverse)
+        Nodes of exclusion_set are neither returned nor walked through,
+        node_id is only returned if it is its own neighbor
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph to walk
+            node_id (str): node identifier
+            recursive (bool): whether to walk further than neighbors
+            exclusion_set (Set[str]): nodes to skip
+
+        Returns:
+            reached nodes ids
+        """
         exclusion_set = exclusion_set or set()
         graph = self.get_graph(session_id=session_id, graph_key=graph_key)
-        if not graph or node_id not in graph.nodes:
+        if not graph or node_id not in graph:
             return set()
         current = {
-            n for n in graph.predecessors(n=node_id) if n not in exclusion_set
+            n
+            for n in self._neighbors(
+                session_id, graph_key, graph, node_id, reverse=reverse
+            )
+            if n not in exclusion_set
         }
-
         if not recursive:
             return current
 
-        exclusion_set.add(node_id)
-        exclusion_set = exclusion_set.union(current)
-        return current.union(
-            *(
-                self.get_predecessors(
-                    session_id=session_id,
-                    graph_key=graph_key,
-                    node_id=s,
-                    recursive=recursive,
+        if (
+            config.CSR_ADJACENCY
+            and len(graph) >= VECTORIZED_BFS_MIN_NODES
+            and (
+                reached := self._csr_reachable(
+                    session_id,
+                    graph_key,
+                    graph,
+                    node_id=node_id,
+                    current=current,
                     exclusion_set=exclusion_set,
+                    reverse=reverse,
                 )
-                for s in current
             )
+            is not None
+        ):
+            return current.union(reached)
+
+        seen = exclusion_set | current
+        seen.add(node_id)
+        queue = deque(current)
+        while queue:
+            for n in self._neighbors(
+                session_id, graph_key, graph, queue.popleft(), reverse=reverse
+            ):
+                if n not in seen:
+                    seen.add(n)
+                    current.add(n)
+                    queue.append(n)
+        return current
+
+    def _csr_reachable(
+        self,
+        session_id: str,
+        graph_key: str,
+        graph: nx.DiGraph,
+        node_id: int,
+        current: Set[int],
+        exclusion_set: Set[int],
+        reverse: bool = False,
+    ) -> Optional[List[int]]:
+        """
+        _reachable walk beyond current, vectorized on the packed adjacency
+
+        Args:
+            session_id (str): user session identifier
+            graph_key (str): id of the graph to walk
+            graph (nx.DiGraph): the session graph
+            node_id (str): walk start
+            current (Set[int]): neighbors of node_id, already reached
+            exclusion_set (Set[str]): nodes to skip
+            reverse (bool): whether to walk predecessors
+
+        Returns:
+            reached nodes ids, None if the packed adjacency is behind graph
+        """
+        index, offsets, _, indices, nodes = self._csr_for(
+            session_id, graph_key, graph, reverse=reverse
+        )
+        if node_id not in index or not current.issubset(index):
+            return None
+        seen = np.zeros(len(index), dtype=bool)
+        seen[[index[n] for n in exclusion_set if n in index]] = True
+        current_rows = np.fromiter(
+            (index[n] for n in current), dtype=np.int64, count=len(current)
         )
+        seen[current_rows] = True
+        seen[index[node_id]] = True
+        rows = commons.csr_reachable(offsets, indices, current_rows, seen)
+        return [nodes[row] for row in rows.tolist()]
 
     def __add_nodes_edges_to_task(
-        self, session_id: str, graph_key: str, task_id: str
+        self,
+        session_id: str,
+        graph_key: str,
+        task_id: str,
+        nodes_ids: Optional[List[str | int]] = None,
+        edges: Optional[List[Tuple[str | int, str | int]]] = None,
     ):
         """
         Add nodes and edges to task result.
         Used to set intermediate (when task still running) results.
+        Only new nodes and edges are serialized once the task has a result,
+        the full graph is serialized on first publish. Nodes created by an
+        edge only are left out until styled, each node is published once.
 
         Args:
             session_id (str): user session identifier
             graph_key (str): id of the graph to relate item in
             task_id (str): if provided, set intermediate results to task
+            nodes_ids (List[str | int]): nodes styled since last publish
+            edges (List[Tuple[str | int, str | int]]): edges added since
+                last publish
         """
         current_graph = self.get_graph(
             session_id=session_id, graph_key=graph_key
         )
-        nodes_and_edges = {
-            "nodes": commons.nodes_edges_to_list_of_dict(
-                current_graph, constants.NODES  # type: ignore
+        if current_graph is None:
+            return
+        if StatusManager().extend_intermediate_result(
+            task_id=task_id,
+            nodes=commons.nodes_to_list_of_dict(
+                current_graph, nbunch=nodes_ids or ()
             ),
-            "edges": commons.nodes_edges_to_list_of_dict(
-                current_graph, constants.EDGES, system_=constants.VIS_JS_SYS  # type: ignore
+            edges=commons.edges_to_list_of_dict(
+                current_graph,
+                system_=constants.VIS_JS_SYS,
+                ebunch=edges or (),
             ),
-        }
+        ):
+            return
+
+        # first publish, the whole graph is new
         StatusManager().set_intermediate_result(
             task_id=task_id,
-            result=nodes_and_edges,
+            result={
+                constants.NODES: commons.nodes_to_list_of_dict(
+                    current_graph,
+                    nbunch=[
+                        node_id
+                        for node_id, attrs in current_graph._node.items()
+                        if attrs
+                    ],
+                ),
+                constants.EDGES: commons.edges_to_list_of_dict(
+                    current_graph,
+                    system_=constants.VIS_JS_SYS,
+                ),
+            },
         )
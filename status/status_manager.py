@@ -2,8 +2,9 @@
 Singleton to manage task status and results
 """
 
+import threading
 from enum import Enum
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from commons import ThreadSafeSingleton
 
@@ -17,11 +18,53 @@ class ValidStatus(Enum):
     NOT_FOUND = "not_found"
 
 
+_NOT_FOUND_VALUE = ValidStatus.NOT_FOUND.value
+
+
+class _TaskRecord:
+    """
+    Status value, result and error of a task, status None until set.
+    extendable while the result is a published intermediate graph.
+    version is bumped on every write, response is the last polled payload
+    with the version it was built at.
+    """
+
+    __slots__ = (
+        "status",
+        "result",
+        "error",
+        "extendable",
+        "version",
+        "response",
+    )
+
+    def __init__(self):
+        self.status: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        self.extendable: bool = False
+        self.version: int = 0
+        self.response: Optional[Tuple[int, Dict[str, Any]]] = None
+
+
 class StatusManager(metaclass=ThreadSafeSingleton):
     def __init__(self):
-        self.status: Dict[str, ValidStatus] = {}
-        self.results = {}
-        self.errors = {}
+        """
+        _tasks: one record per task id
+
+        Writes are serialized by _lock, reads (get_status...) take no lock,
+        single dict reads are atomic under the GIL.
+        """
+        self._tasks: Dict[str, _TaskRecord] = {}
+        self._lock = threading.RLock()
+
+    def _record(self, task_id: str) -> _TaskRecord:
+        # called under _lock, the record is about to be written
+        record = self._tasks.get(task_id)
+        if record is None:
+            record = self._tasks[task_id] = _TaskRecord()
+        record.version += 1
+        return record
 
     def _set_status(
         self,
@@ -29,23 +72,29 @@ class StatusManager(metaclass=ThreadSafeSingleton):
         status: ValidStatus,
         error: Optional[Exception] = None,
     ) -> ValidStatus:
-        self.status[task_id] = status
-        if error is not None:
-            self.errors[task_id] = error
-        return self.status[task_id]
-
-    def _set_result(self, task_id: str, result: Any):
-        self.results[task_id] = result
+        with self._lock:
+            record = self._record(task_id)
+            record.status = status.value
+            if error is not None:
+                record.error = error
+        return status
+
+    def _set_result(self, task_id: str, result: Any, extendable=False):
+        with self._lock:
+            record = self._record(task_id)
+            record.result = result
+            record.extendable = extendable
 
     @property
     def all_tasks(self):
         return [
             {
                 "task_id": task_id,
-                "result": self.results.get(task_id),
-                "error": self.errors.get(task_id),
+                "result": record.result,
+                "error": record.error,
             }
-            for task_id in self.status
+            for task_id, record in list(self._tasks.items())
+            if record.status is not None
         ]
 
     def create_task(self, task_id: str) -> ValidStatus:
@@ -55,7 +104,33 @@ class StatusManager(metaclass=ThreadSafeSingleton):
         return self._set_status(task_id=task_id, status=ValidStatus.RUNNING)
 
     def set_intermediate_result(self, task_id: str, result: Any):
-        self._set_result(task_id=task_id, result=result)
+        self._set_result(task_id=task_id, result=result, extendable=True)
+
+    def extend_intermediate_result(
+        self,
+        task_id: str,
+        nodes: List[Dict[str, Any]],
+        edges: List[Dict[str, Any]],
+    ) -> bool:
+        """
+        Append new nodes and edges to the task intermediate result
+
+        Args:
+            task_id: uuid of the task
+            nodes: nodes added since last publish
+            edges: edges added since last publish
+
+        Returns:
+            False if there is no published graph to extend
+        """
+        with self._lock:
+            record = self._tasks.get(task_id)
+            if record is None or not record.extendable:
+                return False
+            record.result["nodes"].extend(nodes)
+            record.result["edges"].extend(edges)
+            record.version += 1
+        return True
 
     def fail_task(self, task_id: str, error: Optional[Exception] = None):
         self._set_status(
@@ -68,13 +143,17 @@ class StatusManager(metaclass=ThreadSafeSingleton):
         status: ValidStatus,
         result: Optional[Any] = None,
     ) -> ValidStatus:
-        self._set_status(task_id=task_id, status=status)
-        if result is not None:
-            self._set_result(task_id=task_id, result=result)
-        return self.status[task_id]
+        with self._lock:
+            self._set_status(task_id=task_id, status=status)
+            if result is not None:
+                self._set_result(task_id=task_id, result=result)
+        return status
 
     def get_status(self, task_id: str) -> str:
-        return self.status.get(task_id, ValidStatus.NOT_FOUND).value
+        record = self._tasks.get(task_id)
+        if record is None or record.status is None:
+            return _NOT_FOUND_VALUE
+        return record.status
 
     def get_status_and_result(self, task_id: str) -> Dict[str, Any]:
         """
@@ -84,13 +163,26 @@ class StatusManager(metaclass=ThreadSafeSingleton):
             task_id: uuid of the task
 
         Returns:
-            dict with 'status', 'result' and 'error' keys
+            dict with 'status', 'result' and 'error' keys,
+            the same dict until the task is written again
         """
-        result = self.results.get(task_id, {})
-        if result is not None and not isinstance(result, dict):
+        record = self._tasks.get(task_id)
+        if record is None:
+            record = _TaskRecord()
+        # read before building, a concurrent write makes the cache stale
+        version = record.version
+        cached = record.response
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        result = record.result
+        if result is None:
+            result = {}
+        elif not isinstance(result, dict):
             result = {"result": result}
-        return {
-            "status": self.status.get(task_id, ValidStatus.NOT_FOUND).value,
+        response = {
+            "status": self.get_status(task_id),
             **result,
-            "error": self.errors.get(task_id),
+            "error": record.error,
         }
+        record.response = (version, response)
+        return response
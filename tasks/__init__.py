@@ -1,2 +1,2 @@
-from .task import Task
+from .task import Task, TaskQueueFull
 from .task_manager import TaskManager
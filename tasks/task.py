@@ -2,11 +2,30 @@
 Task model to automatically set task status and result
 """
 
+import logging
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Callable
 
+from config import TASK_WORKERS
 from status import StatusManager, ValidStatus
 
+_LOG = logging.getLogger(__name__)
+
+# threaded tasks share these workers, extra tasks wait in queue
+_TASK_POOL = ThreadPoolExecutor(
+    max_workers=TASK_WORKERS, thread_name_prefix="task"
+)
+# tasks waiting for a worker, further threaded tasks are refused
+TASK_QUEUE_SIZE = 256
+_task_slots = threading.BoundedSemaphore(TASK_WORKERS + TASK_QUEUE_SIZE)
+
+
+class TaskQueueFull(RuntimeError):
+    """
+    Raised when every worker is busy and the task queue is full
+    """
+
 
 class Task:
     """
@@ -14,12 +33,14 @@ class Task:
     Threading mode optional.
     """
 
+    __slots__ = ("target", "task_uuid", "use_threading", "logger", "kwargs")
+
     def __init__(
         self,
         target: Callable,
         task_uuid: str,
         use_threading: bool = False,
-        logger: Callable = print,
+        logger: Callable = _LOG.debug,
         **kwargs,
     ):
         self.target = target
@@ -29,31 +50,51 @@ class Task:
         self.kwargs = kwargs
 
     def run(self) -> Any:
+        """
+        Returns:
+            target result, or its Future in threading mode
+        """
         if not self.use_threading:
             return self._run()
-        self._run_threading()
+        return self._run_threading()
 
-    def _run_threading(self):
-        threading.Thread(target=self._set_task_context_and_run).start()
+    def _run_threading(self) -> Future:
+        if not _task_slots.acquire(blocking=False):
+            raise TaskQueueFull(
+                f"[Error: Task.run] Cannot queue task {self.task_uuid}, "
+                f"{TASK_WORKERS + TASK_QUEUE_SIZE} tasks already pending"
+            )
+        # visible while queued, before a worker picks it up
+        StatusManager().create_task(task_id=self.task_uuid)
+        try:
+            future = _TASK_POOL.submit(self._set_task_context_and_run)
+        except Exception as e:  # e.g. pool shut down
+            _task_slots.release()
+            StatusManager().fail_task(task_id=self.task_uuid, error=e)
+            raise
+        future.add_done_callback(lambda _: _task_slots.release())
+        return future
 
     def _run(self):
         self._set_task_context_and_run()
 
     def _set_task_context_and_run(self) -> Any:
+        status_manager = StatusManager()
         self.logger(f"Creating task {self.task_uuid}")
-        StatusManager().create_task(task_id=self.task_uuid)
+        status_manager.create_task(task_id=self.task_uuid)
         self.logger(f"Running task {self.task_uuid}")
-        StatusManager().run_task(task_id=self.task_uuid)
+        status_manager.run_task(task_id=self.task_uuid)
         try:
             task_result = self.target(**self.kwargs)
         except Exception as e:
-            self.logger(f"Failed task {self.task_uuid}")
-            StatusManager().fail_task(task_id=self.task_uuid, error=e)
+            # threaded callers don't read the future, log the traceback here
+            _LOG.exception(f"Failed task {self.task_uuid}")
+            status_manager.fail_task(task_id=self.task_uuid, error=e)
             tb = e.__traceback__
             raise e.with_traceback(tb)
 
         self.logger(f"Completing task {self.task_uuid}")
-        StatusManager().complete_task(
+        status_manager.complete_task(
             self.task_uuid, status=ValidStatus.COMPLETED, result=task_result
         )
         return task_result
@@ -2,18 +2,159 @@
 Task Manager to instantiate and handle tasks
 """
 
+import logging
+import threading
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import commons
-import constants
 import networkx as nx  # type: ignore
 from api_clients.wrappers import DeezerWrapper
-from config import OUTPUT_DIR
-from items.item import ValidItem
+from config import OUTPUT_DIR, SEARCH_WORKERS, WRITE_GML_LEGACY
+from items.item import DeezerResource, ValidItem
 from items.store import ItemStore
 from tasks.task import Task
 
+_LOG = logging.getLogger(__name__)
+
+_VALID_ITEM_VALUES = frozenset(valid_.value for valid_ in ValidItem)
+
+# disk writes of saved graphs, off the task threads. One worker: a delta
+# is only appended after the snapshot it applies to
+_SLOW_POOL = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="graph-writer"
+)
+
+# fill phase of expansions, the explore phase runs on the task thread
+_FILL_POOL = ThreadPoolExecutor(
+    max_workers=SEARCH_WORKERS, thread_name_prefix="fill"
+)
+
+
+# nodes and edges last submitted for each snapshot, to append only changes
+_saved_contents: Dict[Path, Tuple[Set[Any], Set[Tuple[Any, Any]]]] = {}
+_saved_lock = threading.Lock()
+
+
+def _log_write_error(future: Future):
+    if (error := future.exception()) is not None:
+        _LOG.error("Failed to save graph: %s", error)
+
+
+def _write_graph_later(
+    graph_: nx.DiGraph, filename: Path, append: bool = False
+):
+    """
+    Write the graph in the background, as gml if WRITE_GML_LEGACY.
+    Otherwise as a node-link json snapshot, or if append and a snapshot was
+    already submitted, by appending the nodes and edges added since to the
+    jsonl log of changes.
+
+    Args:
+        graph_ (nx.DiGraph): detached copy of the graph to save, see
+            ItemStore.copy_graph
+        filename (Path): destination file, without extension
+        append (bool): whether to only append changes since the last save
+    """
+    if WRITE_GML_LEGACY:
+        future = _SLOW_POOL.submit(
+            nx.write_gml,
+            graph_,
+            filename.with_name(filename.name + ".gml"),
+        )
+        future.add_done_callback(_log_write_error)
+        return
+
+    snapshot = filename.with_name(filename.name + ".json")
+    changes = filename.with_name(filename.name + ".jsonl")
+    nodes_ids, edges = set(graph_), set(graph_.edges)
+    # submitted under the lock so that writes run in the order of deltas
+    with _saved_lock:
+        saved = _saved_contents.get(snapshot) if append else None
+        _saved_contents[snapshot] = (nodes_ids, edges)
+        if saved is None:
+            future = _SLOW_POOL.submit(
+                _write_snapshot, graph_, snapshot, changes
+            )
+        else:
+            future = _SLOW_POOL.submit(
+                _append_changes,
+                graph_,
+                changes,
+                [n for n in graph_ if n not in saved[0]],
+                [e for e in graph_.edges if e not in saved[1]],
+            )
+    future.add_done_callback(_log_write_error)
+
+
+def _write_snapshot(graph_: nx.DiGraph, snapshot: Path, changes: Path):
+    commons.write_graph_json(graph_, snapshot)
+    changes.unlink(missing_ok=True)  # included in the snapshot
+
+
+def _append_changes(
+    graph_: nx.DiGraph,
+    changes: Path,
+    nodes_ids: Iterable[int],
+    edges: Iterable[Tuple[int, int]],
+):
+    commons.append_graph_changes(
+        changes,
+        commons.nodes_to_list_of_dict(graph_, nbunch=nodes_ids),
+        commons.edges_to_list_of_dict(graph_, ebunch=edges),
+    )
+
+
+# searches of the same keywords and types reuse the graph built last time
+SEARCH_MEMO_SIZE = 512
+SEARCH_MEMO_TTL = 3600  # seconds
+_search_memo: OrderedDict[
+    Tuple[Any, ...], Tuple[float, nx.DiGraph, List[DeezerResource]]
+] = OrderedDict()
+_search_memo_lock = threading.Lock()
+
+
+def _memoized_search(
+    key: Tuple[Any, ...],
+) -> Optional[Tuple[nx.DiGraph, List[DeezerResource]]]:
+    """
+    Graph and items of a recent search, None if absent or expired
+
+    Args:
+        key (tuple): search memo key
+
+    Returns:
+        (graph, items of its nodes), not to be mutated
+    """
+    with _search_memo_lock:
+        if (memo := _search_memo.get(key)) is None:
+            return None
+        if memo[0] < time.monotonic():
+            del _search_memo[key]
+            return None
+        _search_memo.move_to_end(key)
+        return memo[1], memo[2]
+
+
+def _memoize_search(
+    key: Tuple[Any, ...], graph_: nx.DiGraph, items_: List[DeezerResource]
+):
+    expires_at = time.monotonic() + SEARCH_MEMO_TTL
+    with _search_memo_lock:
+        _search_memo[key] = (expires_at, graph_, items_)
+        _search_memo.move_to_end(key)
+        if len(_search_memo) > SEARCH_MEMO_SIZE:
+            _search_memo.popitem(last=False)
+
+
+# expansions running per (session, graph, node, types), joined not repeated
+_inflight_expansions: Dict[Tuple[Any, ...], Future] = {}
+_inflight_lock = threading.Lock()
+
 
 class TaskManager:
 
@@ -22,6 +163,7 @@ class TaskManager:
         ValidItem.ARTIST.value,
         ValidItem.TRACK.value,
     ]
+    SEARCH_DEPTH = 3
 
     def __init__(
         self,
@@ -41,42 +183,45 @@ class TaskManager:
             selected_types or TaskManager.ALL_TYPES
         )
 
-    def search_task(self, keywords: List[str], save: bool = False):
+    def search_task(
+        self, keywords: List[str], save: bool = False, wait: bool = False
+    ) -> Dict[str, Any]:
         """
-        Search task, returns query node and expand in split thread
+        Search task, sets the query node and expands in split thread.
+        The query graph is only (re)set once the task is queued
 
         Args:
             keywords: Search keywords
             save: whether to write result to local fs
+            wait: whether to wait for the search to complete
 
         Returns:
-            graph summary
+            task id, and the resulting graph if wait. Otherwise the graph is
+            published to the task status as it grows
         """
-        task_id = str(uuid.uuid4())
-        self._graph_key = self._init_query_graph(
-            keywords=keywords, task_id=task_id
-        )
+        task_id = uuid.uuid4().hex
         task = Task(
-            target=self.expand_from_query_node,
+            target=self._search,
             task_uuid=task_id,
             use_threading=True,
             keywords=keywords,
             save=save,
             task_id=task_id,
         )
-        task.run()
-        graph_ = ItemStore().get_graph(
-            session_id=self._session_id, graph_key=self._graph_key
+        running = task.run()
+        if not wait:
+            return {"task_id": task_id}
+        return {"task_id": task_id, **running.result()}
+
+    def _search(
+        self, keywords: List[str], task_id: str, save: bool = False
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        self._graph_key = self._init_query_graph(
+            keywords=keywords, task_id=task_id
+        )
+        return self.expand_from_query_node(
+            keywords=keywords, save=save, task_id=task_id
         )
-        return {
-            "task_id": task_id,
-            "nodes": commons.nodes_edges_to_list_of_dict(
-                graph_, which=constants.NODES
-            ),
-            "edges": commons.nodes_edges_to_list_of_dict(
-                graph_, which=constants.EDGES, system_=constants.VIS_JS_SYS
-            ),
-        }
 
     def expand_from_query_node(
         self,
@@ -95,35 +240,60 @@ class TaskManager:
         assert (
             self._graph_key is not None
         ), "Graph not properly initialized for search. Graph key is None"
-        DeezerWrapper().search(
-            keywords=keywords,
-            session_id=self._session_id,
-            graph_key=self._graph_key,
-            max_depth=3,
-            restricted_types=self._selected_types,
-            task_id=task_id,
-        )
-        current_graph = ItemStore().get_graph(
-            session_id=self._session_id, graph_key=self._graph_key
+        store = ItemStore()
+        # graph key is built from the keywords
+        memo_key = (
+            self._graph_key,
+            tuple(sorted(self._selected_types)),
+            TaskManager.SEARCH_DEPTH,
         )
-
-        if save:
-            if save:
-                OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-                filename = OUTPUT_DIR / (
-                    "_".join([self._graph_key, "0", "4"]) + ".gml"
+        if (memo := _memoized_search(memo_key)) is not None:
+            store.load_graph(
+                session_id=self._session_id,
+                graph_key=self._graph_key,
+                graph_=memo[0],
+                items_=memo[1],
+                task_id=task_id,
+            )
+        else:
+            DeezerWrapper().search(
+                keywords=keywords,
+                session_id=self._session_id,
+                graph_key=self._graph_key,
+                max_depth=TaskManager.SEARCH_DEPTH,
+                restricted_types=self._selected_types,
+                task_id=task_id,
+            )
+            # memoize a copy taken under the session lock
+            searched = store.copy_graph(
+                session_id=self._session_id, graph_key=self._graph_key
+            )
+            if searched is not None:
+                _memoize_search(
+                    memo_key,
+                    searched,
+                    [
+                        item_
+                        for node_id in searched
+                        if (item_ := store.get(node_id)) is not None
+                    ],
                 )
-                nx.write_gml(current_graph, filename)
 
-        res = {
-            "nodes": commons.nodes_edges_to_list_of_dict(
-                current_graph, constants.NODES
-            ),
-            "edges": commons.nodes_edges_to_list_of_dict(
-                current_graph, constants.EDGES, system_=constants.VIS_JS_SYS
-            ),
-        }
-        return res
+        saved_graph = (
+            store.copy_graph(
+                session_id=self._session_id, graph_key=self._graph_key
+            )
+            if save
+            else None
+        )
+        if saved_graph is not None:
+            commons.ensure_dir(OUTPUT_DIR)
+            filename = OUTPUT_DIR / "_".join([self._graph_key, "0", "4"])
+            _write_graph_later(saved_graph, filename)
+
+        return store.snapshot_graph(
+            session_id=self._session_id, graph_key=self._graph_key
+        )
 
     def _init_query_graph(self, keywords: List[str], task_id: str) -> str:
         """
@@ -157,7 +327,7 @@ class TaskManager:
         Returns:
             task id
         """
-        task_id = str(uuid.uuid4())
+        task_id = uuid.uuid4().hex
         task = Task(
             target=self.expand_from_node,
             task_uuid=task_id,
@@ -173,7 +343,8 @@ class TaskManager:
         self, node_id: int, item_type: Optional[str] = None, save: bool = False
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
-        Expand the graph from one node
+        Expand the graph from one node.
+        Joins the running expansion of the same node in the same graph if any.
 
         Args:
             node_id (int): node from which to expand
@@ -183,13 +354,56 @@ class TaskManager:
         Returns:
             nodes and edges as dict
         """
+        key = (
+            self._session_id,
+            self._graph_key,
+            node_id,
+            tuple(sorted(self._selected_types)),
+        )
+        owned: Future = Future()
+        with _inflight_lock:
+            expansion = _inflight_expansions.setdefault(key, owned)
+        if expansion is not owned:
+            return expansion.result()
+
+        try:
+            result = self._expand_from_node(
+                node_id=node_id, item_type=item_type, save=save
+            )
+        except Exception as e:
+            expansion.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                del _inflight_expansions[key]
+        expansion.set_result(result)
+        return result
 
+    def _expand_from_node(
+        self, node_id: int, item_type: Optional[str] = None, save: bool = False
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        assert self._graph_key is not None, "Graph key not provided for expand"
         store = ItemStore()
-        item_ = store.get(item_id=node_id)
+        graph_ = store.get_graph(
+            session_id=self._session_id, graph_key=self._graph_key
+        )
+        if store.is_expanded(
+            session_id=self._session_id,
+            graph_key=self._graph_key,
+            node_id=node_id,
+        ):  # its neighbors are already in the graph
+            return store.snapshot_graph(
+                session_id=self._session_id, graph_key=self._graph_key
+            )
+        node_ = graph_.nodes.get(node_id) if graph_ is not None else None
+        if node_ is not None and not node_.get("expand_enabled", True):
+            # nothing to add, the graph as it is
+            return store.snapshot_graph(
+                session_id=self._session_id, graph_key=self._graph_key
+            )
+        item_ = store.get(item_id=node_id, item_type=item_type)
         if item_ is None:
-            if item_type is None or item_type not in [
-                valid_.value for valid_ in ValidItem
-            ]:
+            if item_type is None or item_type not in _VALID_ITEM_VALUES:
                 raise ValueError(
                     f"""
                     [task_manager.expand_from_node] item {node_id} not in cache and
@@ -201,13 +415,12 @@ class TaskManager:
                 item_id=node_id,
                 item_type=ValidItem(item_type),
             )
-        assert self._graph_key is not None, "Graph key not provided for expand"
-
         # Fill and Explore
         #  Same color group
         nodes_color = commons.random_color_generator()
-        #  Fill first
-        DeezerWrapper.fill(
+        #  Fill in the background, independent of exploring
+        filling = _FILL_POOL.submit(
+            DeezerWrapper.fill,
             session_id=self._session_id,
             graph_key=self._graph_key,
             item_=item_,
@@ -215,36 +428,39 @@ class TaskManager:
             depth=1,
             color=nodes_color,
         )
-        #  Then explore
+        #  Explore meanwhile
         DeezerWrapper.find_related(
             session_id=self._session_id,
             graph_key=self._graph_key,
             item_=item_,
             depth=1,  # activate expand enabled
             max_depth=1,
-            backbone_type=DeezerWrapper().get_backbone_type(
+            backbone_type=DeezerWrapper.get_backbone_type(
                 self._selected_types
             ),
             star_types=self._selected_types,
             exploration_mode=True,
             color=nodes_color,
         )
-        current_graph = ItemStore().get_graph(
-            session_id=self._session_id, graph_key=self._graph_key
+        filling.result()
+        store.mark_expanded(
+            session_id=self._session_id,
+            graph_key=self._graph_key,
+            node_id=node_id,
         )
 
-        if save:
-            OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-            filename = OUTPUT_DIR / (
-                "_".join([self._graph_key, "0", "4"]) + ".gml"
+        saved_graph = (
+            store.copy_graph(
+                session_id=self._session_id, graph_key=self._graph_key
             )
-            nx.write_gml(current_graph, filename)
+            if save
+            else None
+        )
+        if saved_graph is not None:
+            commons.ensure_dir(OUTPUT_DIR)
+            filename = OUTPUT_DIR / "_".join([self._graph_key, "0", "4"])
+            _write_graph_later(saved_graph, filename, append=True)
 
-        return {
-            "nodes": commons.nodes_edges_to_list_of_dict(
-                current_graph, constants.NODES
-            ),
-            "edges": commons.nodes_edges_to_list_of_dict(
-                current_graph, constants.EDGES
-            ),
-        }
+        return store.snapshot_graph(
+            session_id=self._session_id, graph_key=self._graph_key
+        )